@@ -16,6 +16,23 @@ import hashlib
 from streamlit_option_menu import option_menu
 import datetime
 from xai_engine import explain_prediction
+import json
+from archive_engine import (read_table, read_cold, archive_table, frame_memory_mb, ARCHIVE_TABLES,
+                            DEFAULT_ARCHIVE_AGE_DAYS)
+from shard_engine import (CENTRAL_DB, DEFAULT_BRANCH, shard_path, shard_archive_dir, valid_branch_code, fan_out,
+                          merge_frames)
+from portfolio_engine import portfolio_projection, DEFAULT_LGD
+from counterfactual_engine import find_counterfactuals
+from feature_store import (FEATURES_TABLE_SQL, TRAINING_COLUMNS, TRAINING_INDEX_SQL, save_features, set_decisions,
+                           load_features, count_new_labels)
+from training_engine import MODEL_PATH, MIN_NEW_RECORDS, init_checkpoint_table, fine_tune
+from stress_engine import DEFAULT_SCENARIOS, compile_scenarios, scenarios_to_frame, stress_test
+from export_engine import BatchExportWriter, RESULT_COLUMNS, remove_export, sweep_stale_exports
+from drift_engine import (DRIFT_TABLE_SQL, sketch_counts, record_sketches, load_sketches, load_daily_sketches,
+                          merge_counts, load_reference,
+                          drift_report, bin_labels, psi, PSI_WARN, PSI_ALERT)
+from rule_engine import (DEFAULT_RULES, clean_rule, compile_rules, apply_score_rules, apply_decision_rules,
+                         rules_to_frame)
 
 # --- 1. SAYFA AYARLARI VE CSS ---
 st.set_page_config(page_title="BankFlow | Kurumsal Kredi Yönetimi", page_icon="🏦", layout="wide")
@@ -35,19 +52,33 @@ st.markdown("""
 
 
 # --- 2. VERİ TABANI VE GÜVENLİK ---
+@st.cache_resource
 def init_db():
-    with sqlite3.connect('banka_veritabani.db') as conn:
+    # Şema ve göçler süreç başına bir kez (her etkileşimde tüm şube dosyaları açılmaz);
+    # sonradan açılan şubelerin parçası "Şube Aç" ile oluşturulur
+    sweep_stale_exports()  # Önceki süreçten kalan toplu sorgu dosyaları
+    with sqlite3.connect(CENTRAL_DB) as conn:
         c = conn.cursor()
         c.execute('CREATE TABLE IF NOT EXISTS users (email TEXT PRIMARY KEY, password TEXT, role TEXT, name TEXT)')
-        c.execute('''CREATE TABLE IF NOT EXISTS credit_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT, 
-            masked_tc TEXT, tc_hash TEXT, musteri_yas INTEGER, kredi_miktari INTEGER, 
-            vade INTEGER, risk_skoru INTEGER, sonuc TEXT, durum TEXT, personel TEXT, tarih TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        if 'sube_id' not in [r[1] for r in c.execute("PRAGMA table_info(users)").fetchall()]:
+            c.execute(f"ALTER TABLE users ADD COLUMN sube_id TEXT DEFAULT '{DEFAULT_BRANCH}'")
+        c.execute('CREATE TABLE IF NOT EXISTS branches (kod TEXT PRIMARY KEY, ad TEXT)')
+        c.execute("INSERT OR IGNORE INTO branches (kod, ad) VALUES (?, ?)", (DEFAULT_BRANCH, 'Merkez Şube'))
         c.execute('CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value REAL)')
-        c.execute(
-            'CREATE TABLE IF NOT EXISTS audit_logs (id INTEGER PRIMARY KEY AUTOINCREMENT, user TEXT, action TEXT, details TEXT, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP)')
+
+        c.execute('''CREATE TABLE IF NOT EXISTS policy_rules (
+            kod TEXT PRIMARY KEY, sira INTEGER, grup TEXT, asama TEXT, kosul TEXT,
+            puan INTEGER, sonuc TEXT, mesaj TEXT, aktif INTEGER DEFAULT 1)''')
+        init_checkpoint_table(c)  # Artımlı model güncellemeleri (bkz. training_engine)
 
         c.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('risk_threshold', 1400)")
+        c.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('archive_age_days', ?)",
+                  (DEFAULT_ARCHIVE_AGE_DAYS,))
+
+        # Varsayılan kurallar sadece ilk kurulumda yazılır; müdürün sildiği kurallar geri gelmez
+        c.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('policy_rules_seeded', 1)")
+        if c.rowcount == 1:
+            save_policy_rules(DEFAULT_RULES, conn)
 
         admin_mail = 'admin@admin.com'
         admin_check = c.execute("SELECT * FROM users WHERE email=?", (admin_mail,)).fetchone()
@@ -55,7 +86,55 @@ def init_db():
             sifre = os.getenv('ADMIN_PASSWORD')
             if sifre: 
                 hashed_admin_pass = bcrypt.hashpw(sifre.encode(), bcrypt.gensalt()).decode()
-                c.execute("INSERT INTO users VALUES (?, ?, ?, ?)", (admin_mail, hashed_admin_pass, 'admin', 'Şube Müdürü'))
+                c.execute("INSERT INTO users (email, password, role, name, sube_id) VALUES (?, ?, ?, ?, ?)",
+                          (admin_mail, hashed_admin_pass, 'admin', 'Şube Müdürü', DEFAULT_BRANCH))
+        branches = [r[0] for r in c.execute("SELECT kod FROM branches").fetchall()]
+    for kod in branches:
+        init_shard(kod)
+
+
+def init_shard(kod):
+    # Şubenin operasyonel tabloları (başvurular ve denetim kayıtları)
+    os.makedirs(os.path.dirname(shard_path(kod)) or '.', exist_ok=True)
+    with sqlite3.connect(shard_path(kod)) as conn:
+        c = conn.cursor()
+        c.execute('''CREATE TABLE IF NOT EXISTS credit_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, 
+            masked_tc TEXT, tc_hash TEXT, musteri_yas INTEGER, kredi_miktari INTEGER, 
+            vade INTEGER, risk_skoru INTEGER, sonuc TEXT, durum TEXT, personel TEXT, tarih TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        # Eski veritabanları için sütun göçü
+        ch_cols = [r[1] for r in c.execute("PRAGMA table_info(credit_history)").fetchall()]
+        if 'faiz' not in ch_cols:
+            c.execute("ALTER TABLE credit_history ADD COLUMN faiz REAL")
+        if 'sube_id' not in ch_cols:
+            c.execute(f"ALTER TABLE credit_history ADD COLUMN sube_id TEXT DEFAULT '{kod}'")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_credit_history_durum ON credit_history (durum)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_credit_history_tarih ON credit_history (tarih)")
+        c.execute(
+            'CREATE TABLE IF NOT EXISTS audit_logs (id INTEGER PRIMARY KEY AUTOINCREMENT, user TEXT, action TEXT, details TEXT, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP)')
+        c.execute(FEATURES_TABLE_SQL)  # Başvuruların model girdileri (bkz. feature_store)
+        c.execute(DRIFT_TABLE_SQL)  # Skor/girdi dağılımı izleme sayaçları (bkz. drift_engine)
+        cf_cols = [r[1] for r in c.execute("PRAGMA table_info(credit_features)").fetchall()]
+        for col, sql_type in TRAINING_COLUMNS.items():
+            if col not in cf_cols:
+                c.execute(f"ALTER TABLE credit_features ADD COLUMN {col} {sql_type}")
+        c.execute(TRAINING_INDEX_SQL)
+
+def save_policy_rules(rules, conn):
+    conn.execute("DELETE FROM policy_rules")
+    conn.executemany('''INSERT INTO policy_rules (kod, sira, grup, asama, kosul, puan, sonuc, mesaj, aktif)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                     [(r['kod'], int(r['sira']), r.get('grup'), r['asama'],
+                       r['kosul'] if isinstance(r['kosul'], str) else json.dumps(r['kosul'], ensure_ascii=False),
+                       int(r.get('puan') or 0), r.get('sonuc') or None, r.get('mesaj'),
+                       1 if r.get('aktif') is None else int(r['aktif']))
+                      for r in map(clean_rule, rules)])
+
+
+def load_policy():
+    rules = get_db_data("SELECT * FROM policy_rules").to_dict('records')
+    return compile_rules(rules)
+
 
 def get_tc_hash(tc):
     return hashlib.sha256(tc.encode()).hexdigest()
@@ -65,77 +144,303 @@ def mask_tc(tc):
     return f"{tc[:3]}*****{tc[-3:]}"
 
 
-def log_action(user, action, details=""):
-    with sqlite3.connect('banka_veritabani.db') as conn:
+def current_branch():
+    return st.session_state.get('sube') or DEFAULT_BRANCH
+
+
+def branch_db(sube=None):
+    # Başvuru ve denetim tabloları oturumdaki şubenin parçasındadır
+    return shard_path(sube or current_branch())
+
+
+def is_regional_admin():
+    return st.session_state.get('role') == 'admin' and current_branch() == DEFAULT_BRANCH
+
+
+def get_branches():
+    return get_db_data("SELECT kod, ad FROM branches ORDER BY kod")
+
+
+def log_action(user, action, details="", sube=None):
+    with sqlite3.connect(branch_db(sube)) as conn:
         conn.execute("INSERT INTO audit_logs (user, action, details) VALUES (?, ?, ?)", (user, action, str(details)))
 
 
-def get_db_data(query, params=()):
-    with sqlite3.connect('banka_veritabani.db') as conn:
+def get_db_data(query, params=(), db_path=CENTRAL_DB):
+    with sqlite3.connect(db_path) as conn:
         return pd.read_sql_query(query, conn, params=params)
 
 
+def get_branch_data(query, params=(), sube=None):
+    return get_db_data(query, params, branch_db(sube))
+
+
+def get_table_data(table, columns=None, start=None, filters=None, sube=None, compact=False):
+    # Sıcak tablo + parquet arşivi birlikte (bkz. archive_engine); compact: kategorik ve 32/16 bit tipler
+    sube = sube or current_branch()
+    return read_table(shard_path(sube), table, columns, start=start, filters=filters,
+                      archive_dir=shard_archive_dir(sube), compact=compact)
+
+
+def get_role_map():
+    return get_db_data("SELECT name, role FROM users").drop_duplicates('name').set_index('name')['role']
+
+
 def execute_db(query, params=()):
-    with sqlite3.connect('banka_veritabani.db') as conn:
+    with sqlite3.connect(CENTRAL_DB) as conn:
         conn.execute(query, params)
 
 
-def add_history(tc, yas, miktar, vade, skor, sonuc, durum, personel):
+HISTORY_INSERT = '''INSERT INTO credit_history 
+    (masked_tc, tc_hash, musteri_yas, kredi_miktari, vade, risk_skoru, sonuc, durum, personel, faiz, sube_id) 
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+
+
+def add_history(tc, yas, miktar, vade, skor, sonuc, durum, personel, faiz=None, features=None, vector=None):
+    # features: modelin girdi sözlüğü, vector: ön işleyici çıktısı; verilirse aynı işlemde credit_features'a yazılır
     masked = mask_tc(tc)
     h_tc = get_tc_hash(tc)
-    with sqlite3.connect('banka_veritabani.db') as conn:
-        conn.execute('''INSERT INTO credit_history 
-            (masked_tc, tc_hash, musteri_yas, kredi_miktari, vade, risk_skoru, sonuc, durum, personel) 
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                     (masked, h_tc, yas, miktar, vade, skor, sonuc, durum, personel))
+    with sqlite3.connect(branch_db()) as conn:
+        cur = conn.execute(HISTORY_INSERT, (masked, h_tc, yas, miktar, vade, skor, sonuc, durum, personel, faiz,
+                                            current_branch()))
+        if features is not None:
+            save_features(conn, [cur.lastrowid], pd.DataFrame([features]),
+                          None if vector is None else np.atleast_2d(vector))
+
+
+def add_history_bulk(records, features=None, vectors=None):
+    # records: HISTORY_INSERT sırasıyla (masked_tc, tc_hash, ..., faiz) demetleri; tek işlemde yazılır
+    # features: records ile aynı sırada model girdileri (DataFrame); kayıt numaraları için satır satır eklenir
+    sube = current_branch()
+    with sqlite3.connect(branch_db(sube)) as conn:
+        if features is None:
+            conn.executemany(HISTORY_INSERT, [(*r, sube) for r in records])
+        else:
+            ids = [conn.execute(HISTORY_INSERT, (*r, sube)).lastrowid for r in records]
+            save_features(conn, ids, features, vectors)
+
+
+def today_range():
+    # Yerel gün aralığı (tarih LIKE 'YYYY-MM-DD%' ile aynı satırlar, ama indeks kullanılabilir)
+    today = datetime.date.today()
+    return today.strftime('%Y-%m-%d'), (today + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+
+
+def _today_hashes(kod, h_tc=None):
+    query = "SELECT tc_hash FROM credit_history WHERE tarih >= ? AND tarih < ?"
+    params = today_range()
+    if h_tc is not None:
+        query, params = query + " AND tc_hash = ?", (*params, h_tc)
+    with sqlite3.connect(shard_path(kod)) as conn:
+        return {r[0] for r in conn.execute(query, params)}
+
+
+def get_today_hashes():
+    # Günlük sorgu sınırı banka geneli: bugünün TC özetleri tüm şubelerden, toplu işte bir kez yüklenir
+    return set().union(*fan_out(_today_hashes, get_branches()['kod']).values())
+
+
+def queried_today(h_tc):
+    # Tekil sorgu: müşteri bugün herhangi bir şubede sorgulandı mı
+    return any(fan_out(lambda kod: _today_hashes(kod, h_tc), get_branches()['kod']).values())
+
+
+# --- MÜDÜR ONAY KUYRUĞU ---
+PENDING_SORT = {"Tarih": "tarih", "Tutar": "kredi_miktari", "Risk Skoru": "risk_skoru", "Personel": "personel",
+                "Dosya No": "id"}
+PENDING_DECISIONS = {True: ('ONAYLANDI', "Müdür Onayı Verildi"), False: ('REDDEDİLDİ', "Müdür Reddi Verildi")}
+
+
+def count_pending(sube=None):
+    with sqlite3.connect(branch_db(sube)) as conn:
+        return conn.execute("SELECT COUNT(*) FROM credit_history WHERE durum='MÜDÜR ONAYINDA'").fetchone()[0]
+
+
+def get_pending_page(sort_by, descending, page_size, page):
+    order = f"{PENDING_SORT[sort_by]} {'DESC' if descending else 'ASC'}, id"
+    return get_branch_data(f"""SELECT id, masked_tc, kredi_miktari, vade, risk_skoru, personel, tarih
+        FROM credit_history WHERE durum='MÜDÜR ONAYINDA' ORDER BY {order} LIMIT ? OFFSET ?""",
+                           (page_size, (page - 1) * page_size))
+
+
+def decide_pending(ids, approve, user):
+    """Seçilen dosyaları tek işlemde onaylar/reddeder; her dosya için bir denetim kaydı yazar.
+    Bu arada başka bir oturumda karara bağlanmış dosyalar atlanır. Karara bağlanan id listesini döner."""
+    sonuc, action = PENDING_DECISIONS[approve]
+    with sqlite3.connect(branch_db()) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        still_pending = [r[0] for r in conn.execute(
+            f"SELECT id FROM credit_history WHERE durum='MÜDÜR ONAYINDA' AND id IN ({','.join('?' * len(ids))})",
+            [int(i) for i in ids])]
+        conn.executemany("UPDATE credit_history SET sonuc=?, durum='TAMAMLANDI' WHERE id=?",
+                         [(sonuc, i) for i in still_pending])
+        conn.executemany("INSERT INTO audit_logs (user, action, details) VALUES (?, ?, ?)",
+                         [(user, action, f"Dosya ID: {i}") for i in still_pending])
+        set_decisions(conn, still_pending, approve)  # Nihai karar artımlı eğitimin etiketi olur
+    return still_pending
+
+
+# --- GRAFİK VERİSİ: SQL'de toplanır, tarayıcıya sadece özet gider ---
+# Performans ekranının kullandığı sütunlar (tc_hash ve diğerleri hiç okunmaz)
+DASHBOARD_COLUMNS = ['id', 'masked_tc', 'musteri_yas', 'kredi_miktari', 'vade', 'risk_skoru', 'sonuc', 'durum',
+                     'personel', 'tarih']
+DRIFT_WINDOWS = {"Bugün": 1, "Son 7 Gün": 7, "Son 30 Gün": 30}  # Model izleme: karşılaştırılan gün sayısı
+PERIODS = {"Tümü": None, "Son 30 Gün": 30, "Son 90 Gün": 90, "Son 1 Yıl": 365}
+MAX_CHART_CATEGORIES = 25  # Grafikte ayrı gösterilecek en fazla personel; kalanlar "Diğer" olur
+MAX_CHART_POINTS = 365  # Zaman serisi grafiğinde en fazla nokta
+# GROUP BY'da takma ad yerine ifadenin kendisi kullanılmalı: SQLite 'Durum'u büyük/küçük harf duyarsız
+# olarak tablodaki 'durum' sütununa bağlar
+DURUM_SQL = "CASE WHEN instr(ch.sonuc, 'ONAY') > 0 THEN 'Onay' ELSE 'Red' END"
+
+
+def period_start(period):
+    days = PERIODS[period]
+    return None if days is None else datetime.datetime.now() - datetime.timedelta(days=days)
+
+
+def _period_where(start, col='ch.tarih'):
+    if start is None: return "", ()
+    return f" WHERE {col} >= ?", (start.strftime('%Y-%m-%d %H:%M:%S'),)
+
+
+def _cold_durum(cold):
+    return np.where(cold['sonuc'].astype(str).str.contains('ONAY', regex=False), 'Onay', 'Red')
+
+
+STRESS_POPULATIONS = {"Onaylı Portföy": True, "Tüm Başvurular": False}
+
+
+def load_stress_features(kod, approved_only):
+    # Şubenin kayıtlı model girdileri; approved_only: sadece müdür/sistem onayıyla kullandırılmış krediler
+    features = load_features(shard_path(kod), archive_dir=shard_archive_dir(kod))
+    if approved_only and not features.empty:
+        book = get_table_data('credit_history', ['id'], sube=kod,
+                              filters=[('durum', '==', 'TAMAMLANDI'), ('sonuc', 'in', list(APPROVED_RESULTS))])
+        features = features[features.index.isin(book['id'])]
+    return features
+
+
+def load_branch_sketches(start=None, end=None):
+    # Dağılım sayaçları şube parçalarındadır; banka geneli için toplanır
+    parts = fan_out(lambda kod: load_sketches(shard_path(kod), start, end), get_branches()['kod'])
+    return merge_counts(parts.values())
+
+
+def load_branch_daily_sketches(ozellik, start=None):
+    days = {}
+    for daily in fan_out(lambda kod: load_daily_sketches(shard_path(kod), ozellik, start),
+                         get_branches()['kod']).values():
+        for gun, counts in daily.items():
+            days.setdefault(gun, []).append({ozellik: counts})
+    return {gun: merge_counts(parts)[ozellik] for gun, parts in days.items()}
+
+
+def get_volume_chart_data(start=None, max_categories=MAX_CHART_CATEGORIES):
+    where, params = _period_where(start)
+    agg = get_branch_data(f"""
+        SELECT ch.personel, {DURUM_SQL} AS Durum,
+               SUM(ch.kredi_miktari) AS kredi_miktari, COUNT(*) AS adet
+        FROM credit_history ch{where}
+        GROUP BY ch.personel, {DURUM_SQL}""", params)
+    cold = read_cold('credit_history', ['personel', 'sonuc', 'kredi_miktari'], start=start,
+                     archive_dir=shard_archive_dir(current_branch()))
+    if not cold.empty:
+        cold = cold.assign(personel=cold['personel'].astype(str), Durum=_cold_durum(cold)).groupby(
+            ['personel', 'Durum'], as_index=False).agg(kredi_miktari=('kredi_miktari', 'sum'),
+                                                       adet=('kredi_miktari', 'size'))
+        agg = pd.concat([agg, cold], ignore_index=True)
+    agg['role'] = agg['personel'].map(get_role_map())
+    totals = agg.groupby('personel')['kredi_miktari'].sum().nlargest(max_categories)
+    agg.loc[~agg['personel'].isin(totals.index), 'personel'] = 'Diğer'
+    return agg.groupby(['personel', 'role', 'Durum'], as_index=False, dropna=False)[['kredi_miktari', 'adet']].sum()
+
+
+def branch_summary(kod, start=None):
+    """Bir şubenin personel/karar bazında özetleri ve bekleyen dosyaları (bölge paneli için; iş parçacığında çalışır)."""
+    where, params = _period_where(start)
+    with sqlite3.connect(shard_path(kod)) as conn:
+        perf = pd.read_sql_query(f"""
+            SELECT ch.personel, {DURUM_SQL} AS Durum, COUNT(*) AS adet,
+                   SUM(ch.kredi_miktari) AS hacim, SUM(ch.risk_skoru) AS skor_toplam
+            FROM credit_history ch{where}
+            GROUP BY ch.personel, {DURUM_SQL}""", conn, params=params)
+        pending = conn.execute("""SELECT COUNT(*), COALESCE(SUM(kredi_miktari), 0), MIN(tarih)
+            FROM credit_history WHERE durum='MÜDÜR ONAYINDA'""").fetchone()
+    cold = read_cold('credit_history', ['personel', 'sonuc', 'kredi_miktari', 'risk_skoru'], start=start,
+                     archive_dir=shard_archive_dir(kod))
+    if not cold.empty:
+        cold = cold.assign(personel=cold['personel'].astype(str), Durum=_cold_durum(cold)).groupby(
+            ['personel', 'Durum'], as_index=False).agg(adet=('kredi_miktari', 'size'), hacim=('kredi_miktari', 'sum'),
+                                                       skor_toplam=('risk_skoru', 'sum'))
+        perf = pd.concat([perf, cold], ignore_index=True).groupby(['personel', 'Durum'], as_index=False).sum()
+    return {'perf': perf, 'pending': pd.DataFrame([pending], columns=['bekleyen', 'bekleyen_tutar', 'en_eski'])}
+
+
+def downsample_sum(x, y, max_points=MAX_CHART_POINTS, first=None, last=None):
+    """Sıralı zaman serisini eşit genişlikte kovalara toplayarak en fazla max_points noktaya indirir.
+    first/last: kova sınırlarının ortak başlangıcı ve bitişi; aynı grafikteki serilerin kovaları hizalı kalır."""
+    x = np.asarray(x, dtype='datetime64[D]')
+    y = np.asarray(y, dtype=np.float64)
+    if len(x) == 0:
+        return x, y
+    first = x[0] if first is None else np.datetime64(first, 'D')
+    last = x[-1] if last is None else np.datetime64(last, 'D')
+    span = (last - first).astype(np.int64) + 1
+    if span <= max_points:
+        return x, y
+    width = int(np.ceil(span / max_points))
+    bucket = (x - first).astype(np.int64) // width
+    sums = np.bincount(bucket, weights=y)
+    starts = first + np.arange(len(sums)) * width
+    keep = np.bincount(bucket) > 0
+    return starts[keep], sums[keep]
+
+
+def get_volume_trend_data(start=None, max_points=MAX_CHART_POINTS):
+    where, params = _period_where(start)
+    daily = get_branch_data(f"""
+        SELECT date(ch.tarih) AS gun, {DURUM_SQL} AS Durum, SUM(ch.kredi_miktari) AS kredi_miktari
+        FROM credit_history ch{where}
+        GROUP BY gun, {DURUM_SQL}""", params)
+    cold = read_cold('credit_history', ['tarih', 'sonuc', 'kredi_miktari'], start=start,
+                     archive_dir=shard_archive_dir(current_branch()))
+    if not cold.empty:
+        cold = cold.assign(gun=cold['tarih'].dt.strftime('%Y-%m-%d'), Durum=_cold_durum(cold)).groupby(
+            ['gun', 'Durum'], as_index=False)['kredi_miktari'].sum()
+        daily = pd.concat([cold, daily], ignore_index=True).groupby(['gun', 'Durum'], as_index=False).sum()
+    daily = daily.sort_values('gun')
+    series = {}
+    for durum, grp in daily.groupby('Durum'):
+        series[durum] = downsample_sum(grp['gun'].to_numpy(), grp['kredi_miktari'].to_numpy(), max_points,
+                                       first=daily['gun'].iloc[0], last=daily['gun'].iloc[-1])
+    return series
 
 
 # --- 3. MODEL YÜKLEME ---
-@st.cache_resource
-def load_assets():
+@st.cache_resource(max_entries=1)
+def load_assets(model_mtime=None):
+    # model_mtime önbellek anahtarıdır: ince ayar (arayüzden veya zamanlanmış görevden) dosyayı değiştirince
+    # bir sonraki çalıştırmada yeni model yüklenir
     try:
-        return tf.keras.models.load_model('kredi_risk_modeli.keras'), joblib.load('veri_isleyici.pkl')
+        return tf.keras.models.load_model(MODEL_PATH), joblib.load('veri_isleyici.pkl')
     except:
         return None, None
 
 
-model, preprocessor = load_assets()
+model, preprocessor = load_assets(os.path.getmtime(MODEL_PATH) if os.path.exists(MODEL_PATH) else None)
 init_db()
 
 
 # --- 4. MODERN HİBRİT KARAR MOTORU ---
-def calculate_hybrid_score(raw_score, inputs):
-    score = raw_score
-    msgs = []
-    scaled_amt = inputs['credit_amount']
-    job_code = inputs['job']
-    history = inputs['credit_history']
-    housing = inputs['housing']
-    age = inputs['age']
-    install_rate = inputs['installment_rate']
-
-    if job_code == 'A171' and history == 'A34':
-        if scaled_amt > 10000:
-            score += 750;
-            msgs.append("🌟 VIP Segment: Kurumsal onay desteği (+750)")
-        else:
-            score += 300;
-            msgs.append("✅ Gelir Gücü: Yönetici statüsü bonusu (+300)")
-    elif job_code == 'A173':
-        score += 150;
-        msgs.append("✅ İstihdam: Nitelikli personel bonusu (+150)")
+def calculate_hybrid_score(raw_score, inputs, policy=None):
+    # Tekil başvuru: kural motorunun tek satırlık çağrısı
+    if policy is None: policy = load_policy()
+    scores, msgs, _ = apply_score_rules(policy, [raw_score], pd.DataFrame([inputs]))
+    return int(scores[0]), msgs[0]
 
-    if history == 'A34':
-        score += 250;
-        msgs.append("✅ Finansal Sicil: Kusursuz ödeme geçmişi (+250)")
-    elif history in ['A30', 'A31', 'A33']:
-        score -= 450;
-        msgs.append("⛔ Kritik Risk: KKB kayıtları sorunlu (-450)")
 
-    if housing == 'A152': score += 150; msgs.append("✅ Teminat: Gayrimenkul güvencesi (+150)")
-    if install_rate == 4: score -= 250; msgs.append("⛔ Borçlanma Oranı: Gelire göre taksitler çok yüksek (-250)")
-
-    return int(max(0, min(1900, score))), msgs
+DEFAULT_INTEREST = 3.99  # Kredi formundaki varsayılan faiz; faizi kayıtlı olmayan eski dosyalar için de kullanılır
+APPROVED_RESULTS = ('ONAYLANABILIR', 'ONAY', 'ONAYLANDI')
 
 
 def calculate_payment(amount, duration, interest):
@@ -264,6 +569,121 @@ maps = {
     'telephone': {'Var': 'A192', 'Yok': 'A191'}
 }
 
+
+def build_batch_input(row):
+    # --- DÜZELTME 1: Excel'deki 'Tutar (TL)' başlığına göre veriyi al ---
+    raw_val = row.get('Tutar (TL)') or row.get('Tutar') or row.get('Kredi Tutarı') or 0
+    current_amt = float(str(raw_val).replace(',', ''))
+
+    # --- DÜZELTME 2: 'Vade' başlığını kontrol et ---
+    current_vade = int(row.get('Vade') or row.get('Vade (Ay)') or 24)
+    current_faiz = float(row.get('Faiz') or row.get('Faiz (%)') or DEFAULT_INTEREST)
+
+    inp_b = {
+        'checking_account': maps['checking_account'].get(row.get('Hesap_Durumu'), 'A14'),
+        'duration': current_vade,
+        # --- DÜZELTME 3: 'KKB Geçmişi' başlığını kontrol et ---
+        'credit_history': maps['credit_history'].get(row.get('KKB Geçmişi') or row.get('KKB_Gecmisi'), 'A32'),
+        'purpose': maps['purpose'].get(row.get('Amac'), 'A40'),
+        'credit_amount': current_amt / 80,  # DÜZELTME: Buraya da temizlenmiş tutarı koyduk
+        'savings_account': maps['savings_account'].get(row.get('Birikim'), 'A65'),
+        'employment': maps['employment'].get(row.get('Kidem'), 'A73'),
+        'installment_rate': int(row.get('Borclanma_Orani', 2)),
+        'status_sex': 'A93', 'guarantors': 'A101', 'residence_since': 4,
+        'property': maps['property'].get(row.get('Teminat'), 'A121'),
+        'age': int(row.get('Yas') or row.get('Müşteri Yaşı') or 30),
+        'other_installments': 'A143',
+        'housing': maps['housing'].get(row.get('Konut'), 'A152'),
+        'existing_credits': 1,
+        'job': maps['job'].get(row.get('Meslek'), 'A173'),
+        'people_liable': 1, 'telephone': 'A191', 'foreign_worker': 'A201'
+    }
+    return current_amt, current_vade, current_faiz, inp_b
+
+
+def normalize_tc(value):
+    # Excel TCKN'yi sayı olarak okuyabilir (12345678901.0)
+    if value is None or (isinstance(value, float) and np.isnan(value)): return ""
+    if isinstance(value, float) and value.is_integer(): return str(int(value))
+    return str(value).strip()
+
+
+def screen_batch_tcs(df_b):
+    """Toplu listedeki TCKN'leri skorlamadan önce eler: geçersiz/eksik, dosyada tekrar eden ve bugün zaten
+    sorgulanmış olanlar. Bugünün özetleri bir kez yüklenir; satır başına sorgu atılmaz.
+    Dönüş: (tc listesi, özet listesi, ret nedeni Series'i - kabul edilenlerde None)"""
+    tc_col = df_b['TC'] if 'TC' in df_b else pd.Series(None, index=df_b.index, dtype=object)
+    if 'TCKN' in df_b: tc_col = tc_col.where(tc_col.notna(), df_b['TCKN'])
+    tcs = [normalize_tc(v) for v in tc_col]
+    hashes = [get_tc_hash(tc) for tc in tcs]
+
+    valid = pd.Series([len(tc) == 11 and tc.isdigit() for tc in tcs], index=df_b.index)
+    h = pd.Series(hashes, index=df_b.index)
+    today_hashes = get_today_hashes()
+    reasons = pd.Series(None, index=df_b.index, dtype=object)
+    reasons[~valid] = "Geçersiz veya eksik TCKN"
+    reasons[valid & h.isin(today_hashes)] = "Bugün zaten sorgulandı (günlük sınır)"
+    reasons[valid & reasons.isna() & h.where(valid).duplicated()] = "Dosyada tekrar eden TCKN"
+    return tcs, hashes, reasons
+
+
+BATCH_CHUNK_ROWS = 5000  # Toplu sorguda tek model çağrısı / veritabanı işlemi / dosya yazımı başına satır
+
+
+def score_batch_chunk(chunk, start, tcs, hashes, reasons, thr, policy):
+    """Toplu listenin bir parçasını skorlar, kaydeder ve dışa aktarım sütunlarını ekler.
+    start: parçanın tüm listedeki ilk satır konumu (tcs/hashes konum bazlı listelerdir).
+    Dönüş: (sonuç sütunları eklenmiş parça, kural isabet sayıları, skorlanan satır sayısı)"""
+    rows_ok, inputs, amounts, vades, faizler = [], [], [], [], []
+    for j, (i, row) in enumerate(chunk.iterrows()):
+        if pd.notna(reasons[i]):
+            continue
+        try:
+            current_amt, current_vade, current_faiz, inp_b = build_batch_input(row)
+        except Exception:
+            continue
+        rows_ok.append(j)
+        inputs.append(inp_b)
+        amounts.append(current_amt)
+        vades.append(current_vade)
+        faizler.append(current_faiz)
+
+    scs = np.zeros(len(chunk), dtype=int)
+    decs = np.full(len(chunk), "HATA", dtype=object)
+    decs[reasons.loc[chunk.index].notna().to_numpy()] = "ATLANDI"
+    durum = np.full(len(chunk), "", dtype=object)
+    mesaj = np.full(len(chunk), "", dtype=object)
+    hits = {}
+    if inputs:
+        # Tek seferde model tahmini + vektörel kural motoru
+        inp_df = pd.DataFrame(inputs)
+        X = preprocessor.transform(inp_df)
+        risk = model.predict(X, verbose=0)[:, 0]
+        raw_scores = ((1 - risk) * 1900).astype(int)
+        record_sketches(branch_db(), sketch_counts(inp_df, raw_scores))
+        f_scores, rule_msgs, score_hits = apply_score_rules(policy, raw_scores, inp_df)
+
+        amounts = np.asarray(amounts, dtype=float)
+        k_sonuc = np.where(f_scores >= thr, "ONAY", "RED").astype(object)
+        k_sonuc, rule_msgs, decision_hits = apply_decision_rules(policy, k_sonuc, f_scores, amounts, rule_msgs)
+        k_durum = np.where(amounts > 500000, "MÜDÜR ONAYINDA", "TAMAMLANDI")
+
+        # Veritabanına kayıt (parça başına tek işlem)
+        add_history_bulk([(mask_tc(tcs[start + j]), hashes[start + j], int(inputs[k]['age']),
+                           int(amounts[k]), vades[k], int(f_scores[k]), k_sonuc[k], k_durum[k],
+                           st.session_state['name'], faizler[k])  # Müdüre kaydet
+                          for k, j in enumerate(rows_ok)], features=inp_df, vectors=X)
+        scs[rows_ok] = f_scores
+        decs[rows_ok] = k_sonuc
+        durum[rows_ok] = k_durum
+        mesaj[rows_ok] = [" | ".join(m) for m in rule_msgs]
+        hits = {**score_hits, **decision_hits}
+
+    out = chunk.assign(AI_Skor=scs, AI_Karar=decs, AI_Durum=durum, Kural_Mesajlari=mesaj,
+                       Ret_Nedeni=reasons.loc[chunk.index].fillna("").to_numpy())
+    return out, hits, len(rows_ok)
+
+
 # --- 5. GİRİŞ VE PANEL ---
 if 'logged_in' not in st.session_state: st.session_state['logged_in'] = False
 
@@ -285,7 +705,8 @@ if not st.session_state['logged_in']:
                     if stored_password and bcrypt.checkpw(password.encode(), stored_password.encode()):
                         st.session_state.clear()
                         st.session_state.update({'logged_in': True, 'email': email, 'role': user.iloc[0]['role'],
-                                                 'name': user.iloc[0]['name']})
+                                                 'name': user.iloc[0]['name'],
+                                                 'sube': user.iloc[0]['sube_id'] or DEFAULT_BRANCH})
                         log_action(email, "Giriş Yapıldı")
                         st.rerun()
                     else:
@@ -314,127 +735,250 @@ if not st.session_state['logged_in']:
 else:
     with st.sidebar:
         st.write(f"### 👤 {st.session_state['name']}")
+        st.caption(f"🏢 Şube: {current_branch()}")
         if st.session_state['role'] == 'admin':
-            pending_count = len(get_db_data("SELECT id FROM credit_history WHERE durum='MÜDÜR ONAYINDA'"))
+            pending_count = count_pending()
             if pending_count > 0: st.sidebar.error(f"🔔 {pending_count} Dosya Onay Bekliyor!")
 
         if st.session_state['role'] == 'admin':
-            m_opts = ["📈 Genel Performans","📂 Toplu Sorgulama", "👥 Personel Yönetimi", "⚙️ Banka Politikası", "🛡️ Hareketler", "Çıkış"]
-            m_icons = ["bar-chart-fill", "file-earmark-spreadsheet-fill", "people-fill", "gear-fill",
-                       "shield-lock-fill", "box-arrow-right"]
+            m_opts = ["📈 Genel Performans", "💹 Portföy Projeksiyonu", "🧪 Stres Testi", "📂 Toplu Sorgulama",
+                      "👥 Personel Yönetimi", "⚙️ Banka Politikası", "📡 Model İzleme", "🛡️ Hareketler", "Çıkış"]
+            m_icons = ["bar-chart-fill", "graph-down", "lightning-charge-fill", "file-earmark-spreadsheet-fill",
+                       "people-fill", "gear-fill", "activity", "shield-lock-fill", "box-arrow-right"]
+            if is_regional_admin():
+                m_opts.insert(1, "🌍 Bölge Paneli")
+                m_icons.insert(1, "globe")
         else:
             m_opts = ["📝 Kredi Başvurusu","📋 Başvurularım", "Çıkış"]
             m_icons = ["pencil-square", "list-task", "box-arrow-right"]
         sel = option_menu("Banka Menü", m_opts, icons=m_icons, menu_icon="bank", default_index=0)
         if sel == "Çıkış":
+            remove_export(st.session_state.get('batch_export_files'))
             st.session_state.clear()  # Tüm oturum verilerini (analiz sonuçları dahil) siler
             st.rerun()
 
     if sel == "📈 Genel Performans":
         st.title("📊 Şube ve Personel Verimlilik Analizi")
-        df = get_db_data("""
-            SELECT ch.*, u.role 
-            FROM credit_history ch 
-            LEFT JOIN users u ON ch.personel = u.name
-        """)
+        period = st.selectbox("Dönem", list(PERIODS.keys()))
+        start = period_start(period)
+        df = get_table_data('credit_history', DASHBOARD_COLUMNS, start=start, compact=True)
 
         if st.session_state['role'] == 'admin':
             st.divider()
             st.subheader("⚠️ Karar Bekleyen Yüksek Tutarlı Başvurular")
 
-            pending_query = "SELECT id, masked_tc, kredi_miktari, vade, risk_skoru, personel, tarih FROM credit_history WHERE durum='MÜDÜR ONAYINDA'"
-            pending_df = get_db_data(pending_query)
-
-            if not pending_df.empty:
-                for _, row in pending_df.iterrows():
-                    # Her dosya için şık bir kutu (expander) oluşturuyoruz
-                    with st.expander(
-                            f"📁 Dosya No: {row['id']} | Müşteri: {row['masked_tc']} | {row['kredi_miktari']:,} TL"):
-                        c1, c2, c3 = st.columns(3)
-                        c1.write(f"**Personel:** {row['personel']}")
-                        c2.write(f"**Risk Skoru:** {row['risk_skoru']}")
-                        c3.write(f"**Tarih:** {row['tarih']}")
-
-                        # Onay ve Red Butonları
-                        btn_onay, btn_red = st.columns(2)
-
-                        if btn_onay.button(f"✅ ONAYLA (ID: {row['id']})", use_container_width=True):
-                            execute_db("UPDATE credit_history SET sonuc='ONAYLANDI', durum='TAMAMLANDI' WHERE id=?",
-                                       (row['id'],))
-                            log_action(st.session_state['email'], "Müdür Onayı Verildi", f"Dosya ID: {row['id']}")
-                            st.success(f"Dosya {row['id']} onaylandı.")
-                            time.sleep(1)
-                            st.rerun()  # Sayfayı yenileyerek listeyi günceller
-
-                        if btn_red.button(f"❌ REDDET (ID: {row['id']})", use_container_width=True):
-                            execute_db("UPDATE credit_history SET sonuc='REDDEDİLDİ', durum='TAMAMLANDI' WHERE id=?",
-                                       (row['id'],))
-                            log_action(st.session_state['email'], "Müdür Reddi Verildi", f"Dosya ID: {row['id']}")
-                            st.warning(f"Dosya {row['id']} reddedildi.")
-                            time.sleep(1)
-                            st.rerun()
+            if 'pending_msg' in st.session_state:
+                st.success(st.session_state.pop('pending_msg'))
+
+            pending_total = count_pending()
+            if pending_total > 0:
+                q1, q2, q3, q4 = st.columns(4)
+                sort_by = q1.selectbox("Sırala", list(PENDING_SORT.keys()))
+                descending = q2.selectbox("Yön", ["Azalan", "Artan"]) == "Azalan"
+                page_size = q3.selectbox("Sayfa Boyutu", [25, 50, 100, 250])
+                n_pages = (pending_total + page_size - 1) // page_size
+                page = q4.number_input(f"Sayfa (/{n_pages})", 1, n_pages, 1)
+
+                pending_df = get_pending_page(sort_by, descending, page_size, page)
+                select_all = st.checkbox(f"Bu sayfadaki {len(pending_df)} dosyanın tümünü seç")
+                pending_df.insert(0, 'Seç', select_all)
+                edited = st.data_editor(
+                    pending_df, hide_index=True, use_container_width=True,
+                    disabled=[c for c in pending_df.columns if c != 'Seç'],
+                    column_config={'kredi_miktari': st.column_config.NumberColumn("Tutar (TL)", format="%d"),
+                                   'masked_tc': "Müşteri", 'risk_skoru': "Risk Skoru", 'id': "Dosya No"},
+                    key=f"pending_{sort_by}_{descending}_{page_size}_{page}_{select_all}")
+                selected = edited.loc[edited['Seç'], 'id'].tolist()
+
+                # Onay ve Red Butonları (seçilen tüm dosyalar için tek işlem)
+                btn_onay, btn_red = st.columns(2)
+                for btn, approve, label in ((btn_onay, True, "✅ SEÇİLENLERİ ONAYLA"),
+                                            (btn_red, False, "❌ SEÇİLENLERİ REDDET")):
+                    if btn.button(f"{label} ({len(selected)})", disabled=not selected, use_container_width=True):
+                        done = decide_pending(selected, approve, st.session_state['email'])
+                        verb = "onaylandı" if approve else "reddedildi"
+                        st.session_state['pending_msg'] = f"{len(done)} dosya {verb}."
+                        st.rerun()  # Sayfayı yenileyerek listeyi günceller
             else:
                 st.success("✅ Onay bekleyen herhangi bir dosya bulunmuyor.")
 
         if not df.empty:
-            df['Durum'] = df['sonuc'].apply(lambda x: 'Onay' if 'ONAY' in x else 'Red')
+            # Kategorik sütunda str işlemi sadece farklı değerler üzerinde çalışır; satır başına apply yok
+            onay = df['sonuc'].str.contains('ONAY', regex=False).to_numpy(dtype=bool)
+            df['Durum'] = pd.Categorical.from_codes((~onay).astype(np.int8), ['Onay', 'Red'])
             c1, c2, c3, c4 = st.columns(4)
             c1.metric("Toplam Sorgu", len(df))
-            c2.metric("Onaylanan Hacim", f"{df[df['Durum'] == 'Onay']['kredi_miktari'].sum():,.0f} TL")
-            c3.metric("Onay Oranı", f"%{(len(df[df['Durum'] == 'Onay']) / len(df)) * 100:.1f}")
+            c2.metric("Onaylanan Hacim", f"{df['kredi_miktari'].to_numpy()[onay].sum(dtype=np.int64):,.0f} TL")
+            c3.metric("Onay Oranı", f"%{onay.mean() * 100:.1f}")
             c4.metric("Ortalama Risk Skoru", int(df['risk_skoru'].mean()))
+            st.caption(f"💾 Analiz verisi: {len(df):,} kayıt, {frame_memory_mb(df):.1f} MB bellek")
 
             st.divider();
             st.subheader("🏆 Personel Performans Analizi")
-            perf = df.groupby(['personel', 'Durum']).size().unstack(fill_value=0)
-            if 'Onay' not in perf: perf['Onay'] = 0
-            if 'Red' not in perf: perf['Red'] = 0
-            st.table(perf.rename(columns={'Onay': '✅ Onaylanan Adet', 'Red': '❌ Reddedilen Adet'}))
+            perf = pd.crosstab(df['personel'], df['Durum']).reindex(columns=['Onay', 'Red'], fill_value=0)
+            perf = perf[perf.sum(axis=1) > 0]  # Kategoride olup bu dönemde sorgusu olmayan personel gösterilmez
+            perf.columns = ['✅ Onaylanan Adet', '❌ Reddedilen Adet']
+            st.table(perf)
 
             t1, t2, t3 = st.tabs(["📊 Hacim Grafiği", "✅ Onaylananlar", "❌ Reddedilenler"])
             with t1:
-                if not df.empty:
-                    # Rol isimlerini daha şık hale getirelim
-                    df['rol_etiket'] = df['role'].map({'admin': '🏦 ŞUBE MÜDÜRÜ', 'personel': '👥 PERSONEL'})
-
-                    # Grafik oluşturma
-                    fig = px.bar(df,
-                                 x='personel',
-                                 y='kredi_miktari',
-                                 color='Durum',
-                                 barmode='group',
-                                 facet_col='rol_etiket',  # Müdür ve personeli ayrı bölmelere ayırır
-                                 pattern_shape='rol_etiket',  # Müdür barlarına ayırıcı bir desen ekler
-                                 category_orders={"rol_etiket": ["🏦 ŞUBE MÜDÜRÜ", "👥 PERSONEL"]},
-                                 labels={
-                                     'personel': 'Yetkili',
-                                     'kredi_miktari': 'Kredi Hacmi (TL)',
-                                     'Durum': 'Karar'
-                                 },
-                                 color_discrete_map={'Onay': '#22c55e', 'Red': '#ef4444'})
-
-                    fig.update_layout(
-                        xaxis_title="",
-                        yaxis_title="Toplam Hacim (TL)",
-                        showlegend=True
-                    )
-
-                    # Grafik başlıklarındaki "rol_etiket=" yazısını temizleyip sadece başlığı bırakır
-                    fig.for_each_annotation(lambda a: a.update(text=a.text.split("=")[-1]))
-
-                    st.plotly_chart(fig, use_container_width=True)
+                # Grafik verisi SQL'de toplanır; bar sayısı kayıt sayısından bağımsızdır
+                chart_df = get_volume_chart_data(start)
+                # Rol isimlerini daha şık hale getirelim
+                chart_df['rol_etiket'] = chart_df['role'].map({'admin': '🏦 ŞUBE MÜDÜRÜ', 'personel': '👥 PERSONEL'})
+
+                # Grafik oluşturma
+                fig = px.bar(chart_df,
+                             x='personel',
+                             y='kredi_miktari',
+                             color='Durum',
+                             barmode='group',
+                             facet_col='rol_etiket',  # Müdür ve personeli ayrı bölmelere ayırır
+                             pattern_shape='rol_etiket',  # Müdür barlarına ayırıcı bir desen ekler
+                             category_orders={"rol_etiket": ["🏦 ŞUBE MÜDÜRÜ", "👥 PERSONEL"]},
+                             hover_data={'adet': True},
+                             labels={
+                                 'personel': 'Yetkili',
+                                 'kredi_miktari': 'Kredi Hacmi (TL)',
+                                 'Durum': 'Karar',
+                                 'adet': 'Başvuru Adedi'
+                             },
+                             color_discrete_map={'Onay': '#22c55e', 'Red': '#ef4444'})
+
+                fig.update_layout(
+                    xaxis_title="",
+                    yaxis_title="Toplam Hacim (TL)",
+                    showlegend=True
+                )
+
+                # Grafik başlıklarındaki "rol_etiket=" yazısını temizleyip sadece başlığı bırakır
+                fig.for_each_annotation(lambda a: a.update(text=a.text.split("=")[-1]))
+
+                st.plotly_chart(fig, use_container_width=True)
+
+                # Zaman içindeki hacim: günlük toplamlar, gerekirse kovalara indirilir (WebGL)
+                fig_trend = go.Figure()
+                for durum, (x, y) in get_volume_trend_data(start).items():
+                    fig_trend.add_trace(go.Scattergl(x=x, y=y, mode='lines', name=durum,
+                                                     line={'color': '#22c55e' if durum == 'Onay' else '#ef4444'}))
+                fig_trend.update_layout(xaxis_title="", yaxis_title="Hacim (TL)")
+                st.plotly_chart(fig_trend, use_container_width=True)
             with t2:
-                st.dataframe(df[df['Durum'] == 'Onay'].drop(columns=['tc_hash']), use_container_width=True)
+                st.dataframe(df[onay], use_container_width=True)
             with t3:
-                st.dataframe(df[df['Durum'] == 'Red'].drop(columns=['tc_hash']), use_container_width=True)
+                st.dataframe(df[~onay], use_container_width=True)
         else:
             st.info("Sistemde henüz kayıtlı veri bulunmuyor.")
 
+    elif sel == "🌍 Bölge Paneli" and is_regional_admin():
+        st.title("🌍 Bölge Performans Paneli")
+        period = st.selectbox("Dönem", list(PERIODS.keys()))
+        start = period_start(period)
+        branches = get_branches()
+
+        t0 = time.perf_counter()
+        results = fan_out(lambda kod: branch_summary(kod, start), branches['kod'].tolist())
+        perf = merge_frames({k: r['perf'] for k, r in results.items()})
+        pending = merge_frames({k: r['pending'] for k, r in results.items()})
+        st.caption(f"⚡ {len(branches)} şube paralel sorgulandı ({time.perf_counter() - t0:.2f} sn)")
+
+        if perf.empty:
+            st.info("Bölgede henüz kayıtlı veri bulunmuyor.")
+        else:
+            onay = perf[perf['Durum'] == 'Onay']
+            total = int(perf['adet'].sum())
+            c1, c2, c3, c4, c5 = st.columns(5)
+            c1.metric("Toplam Sorgu", f"{total:,}")
+            c2.metric("Onaylanan Hacim", f"{onay['hacim'].sum():,.0f} TL")
+            c3.metric("Onay Oranı", f"%{onay['adet'].sum() / total * 100:.1f}")
+            c4.metric("Ortalama Risk Skoru", int(perf['skor_toplam'].sum() / total))
+            c5.metric("Onay Bekleyen", f"{int(pending['bekleyen'].sum()):,}")
+
+            st.divider()
+            st.subheader("🏢 Şube Karşılaştırması")
+            by_branch = perf.groupby('sube_id').agg(sorgu=('adet', 'sum'), skor_toplam=('skor_toplam', 'sum'))
+            by_branch['onay_adet'] = onay.groupby('sube_id')['adet'].sum()
+            by_branch['onay_hacim'] = onay.groupby('sube_id')['hacim'].sum()
+            by_branch = by_branch.fillna(0).join(pending.set_index('sube_id'), how='outer').fillna(
+                {'sorgu': 0, 'skor_toplam': 0, 'onay_adet': 0, 'onay_hacim': 0})
+            branch_table = pd.DataFrame({
+                'Şube': branches.set_index('kod')['ad'].reindex(by_branch.index),
+                'Toplam Sorgu': by_branch['sorgu'].astype(int),
+                'Onaylanan Hacim (TL)': by_branch['onay_hacim'],
+                'Onay Oranı (%)': (by_branch['onay_adet'] / by_branch['sorgu'].replace(0, np.nan) * 100).round(1),
+                'Ort. Risk Skoru': (by_branch['skor_toplam'] / by_branch['sorgu'].replace(0, np.nan)).round(0),
+                'Onay Bekleyen': by_branch['bekleyen'].astype(int),
+                'Bekleyen Tutar (TL)': by_branch['bekleyen_tutar'],
+                'En Eski Bekleyen': by_branch['en_eski']})
+            st.dataframe(branch_table, use_container_width=True)
+            st.plotly_chart(px.bar(branch_table.reset_index(), x='sube_id', y='Onaylanan Hacim (TL)',
+                                   labels={'sube_id': 'Şube'}), use_container_width=True)
+
+            st.subheader("🏆 Personel Performans Analizi")
+            b_perf = perf.pivot_table(index=['sube_id', 'personel'], columns='Durum', values='adet',
+                                      aggfunc='sum', fill_value=0)
+            if 'Onay' not in b_perf: b_perf['Onay'] = 0
+            if 'Red' not in b_perf: b_perf['Red'] = 0
+            st.dataframe(b_perf[['Onay', 'Red']].rename(columns={'Onay': '✅ Onaylanan Adet',
+                                                                  'Red': '❌ Reddedilen Adet'}),
+                         use_container_width=True)
+
+    elif sel == "💹 Portföy Projeksiyonu":
+        st.title("💹 Portföy Nakit Akışı ve Beklenen Kayıp")
+        book = get_table_data('credit_history', ['kredi_miktari', 'vade', 'faiz', 'risk_skoru', 'tarih'],
+                              filters=[('durum', '==', 'TAMAMLANDI'), ('sonuc', 'in', list(APPROVED_RESULTS))],
+                              compact=True)
+        today = pd.Timestamp.now()
+        book['faiz'] = book['faiz'].astype(float).fillna(DEFAULT_INTEREST)
+        book['gecen_ay'] = (today.year - book['tarih'].dt.year) * 12 + (today.month - book['tarih'].dt.month)
+
+        if book.empty:
+            st.info("Projeksiyon için onaylanmış kredi bulunmuyor.")
+        else:
+            lgd = st.slider("Temerrüt Halinde Kayıp Oranı (LGD)", 0.0, 1.0, DEFAULT_LGD, step=0.05)
+            proj = portfolio_projection(book['kredi_miktari'].to_numpy(), book['vade'].to_numpy(),
+                                        book['faiz'].to_numpy(), book['risk_skoru'].to_numpy(),
+                                        elapsed=book['gecen_ay'].to_numpy(), lgd=lgd)
+            if proj.empty:
+                st.info("Onaylı kredilerin tamamının vadesi dolmuş.")
+            else:
+                c1, c2, c3, c4 = st.columns(4)
+                c1.metric("Aktif Kredi", f"{int((book['gecen_ay'] < book['vade']).sum()):,}")
+                c2.metric("Kalan Anapara", f"{proj['anapara'].sum():,.0f} TL")
+                c3.metric("Gelecek Ay Taksit", f"{proj['taksit'].iloc[0]:,.0f} TL")
+                c4.metric("Toplam Beklenen Kayıp", f"{proj['kumulatif_kayip'].iloc[-1]:,.0f} TL")
+
+                p_tab1, p_tab2, p_tab3 = st.tabs(["📉 Bakiye ve Taksit", "⚠️ Beklenen Kayıp", "📋 Aylık Tablo"])
+                with p_tab1:
+                    fig = go.Figure()
+                    for col, name in [('bakiye', 'Kalan Bakiye'), ('taksit', 'Taksit'), ('anapara', 'Anapara'),
+                                      ('beklenen_taksit', 'Beklenen Tahsilat')]:
+                        fig.add_trace(go.Scatter(x=proj['ay'], y=proj[col], mode='lines', name=name))
+                    fig.update_layout(xaxis_title="Ay", yaxis_title="TL")
+                    st.plotly_chart(fig, use_container_width=True)
+                with p_tab2:
+                    fig = go.Figure()
+                    fig.add_trace(go.Bar(x=proj['ay'], y=proj['beklenen_kayip'], name='Aylık Beklenen Kayıp',
+                                         marker_color='#ef4444'))
+                    fig.add_trace(go.Scatter(x=proj['ay'], y=proj['kumulatif_kayip'], mode='lines',
+                                             name='Kümülatif Kayıp', yaxis='y2'))
+                    fig.update_layout(xaxis_title="Ay", yaxis_title="TL",
+                                      yaxis2=dict(overlaying='y', side='right', title='Kümülatif (TL)'))
+                    st.plotly_chart(fig, use_container_width=True)
+                with p_tab3:
+                    st.dataframe(proj.round(2), use_container_width=True)
+
     elif sel == "👥 Personel Yönetimi":
         st.title("👥 Kullanıcı ve Personel Yönetimi")
-        tab1, tab2 = st.tabs(["Personel Listesi", "Yeni Personel Ekle"])
-        with tab1:
-            u_df = get_db_data("SELECT name, email, role FROM users")
+        branches = get_branches()
+        tab_names = ["Personel Listesi", "Yeni Personel Ekle"] + (["🏢 Şubeler"] if is_regional_admin() else [])
+        tabs = st.tabs(tab_names)
+        with tabs[0]:
+            # Bölge yöneticisi tüm şubeleri, şube müdürü kendi şubesini görür
+            if is_regional_admin():
+                u_df = get_db_data("SELECT name, email, role, sube_id FROM users")
+            else:
+                u_df = get_db_data("SELECT name, email, role, sube_id FROM users WHERE sube_id=?", (current_branch(),))
             st.dataframe(u_df, use_container_width=True)
             d_mail = st.selectbox("Silinecek Hesap", u_df['email'].tolist())
             if st.button("Sistemden Sil"):
@@ -445,29 +989,229 @@ else:
                     log_action(st.session_state['email'], "Personel Silindi", d_mail);
                     st.success("Silindi.");
                     st.rerun()
-        with tab2:
+        with tabs[1]:
             with st.form("add"):
                 n_name = st.text_input("Ad Soyad")
                 n_mail = st.text_input("Kurumsal E-posta")
-                n_role = st.selectbox("Yetki", ["personel", "yönetici"])
+                if is_regional_admin():
+                    n_role = st.selectbox("Yetki", ["personel", "yönetici", "admin"])
+                    n_sube = st.selectbox("Şube", branches['kod'].tolist())
+                else:
+                    n_role = st.selectbox("Yetki", ["personel", "yönetici"])
+                    n_sube = current_branch()
                 if st.form_submit_button("Personeli Tanımla"):
-                    execute_db("INSERT INTO users (email, password, role, name) VALUES (?,?,?,?)",
-                               (n_mail, None, n_role, n_name))
+                    execute_db("INSERT INTO users (email, password, role, name, sube_id) VALUES (?,?,?,?,?)",
+                               (n_mail, None, n_role, n_name, n_sube))
                     st.success("Tanımlandı!");
                     st.rerun()
+        if is_regional_admin():
+            with tabs[2]:
+                st.dataframe(branches, use_container_width=True, hide_index=True)
+                with st.form("add_branch"):
+                    b_kod = st.text_input("Şube Kodu (ör. IST_KADIKOY)").strip().upper()
+                    b_ad = st.text_input("Şube Adı")
+                    if st.form_submit_button("Şube Aç"):
+                        if not valid_branch_code(b_kod):
+                            st.error("Şube kodu 2-20 karakter; sadece harf, rakam ve alt çizgi içerebilir.")
+                        else:
+                            execute_db("INSERT OR IGNORE INTO branches (kod, ad) VALUES (?, ?)", (b_kod, b_ad))
+                            init_shard(b_kod)
+                            log_action(st.session_state['email'], "Şube Açıldı", b_kod)
+                            st.success(f"{b_kod} şubesi açıldı.");
+                            st.rerun()
+
+    elif sel == "🧪 Stres Testi":
+        st.title("🧪 Portföy Stres Testi")
+        st.caption("Kayıtlı başvurular senaryodaki şoklarla model ve güncel hibrit kurallarla yeniden skorlanır. "
+                   "Koşul ve şoklar: [[alan, operatör, değer], ...]; şok operatörleri +, * ve = "
+                   "(credit_amount model ölçeğindedir, TL/80). Koşul boşsa şok tüm başvurulara uygulanır.")
+        s1, s2 = st.columns(2)
+        scopes = [current_branch()] + (["Tüm Şubeler"] if is_regional_admin() else [])
+        scope = s1.selectbox("Kapsam", scopes)
+        population = s2.selectbox("Kitle", list(STRESS_POPULATIONS.keys()))
+        scen_df = st.data_editor(scenarios_to_frame(DEFAULT_SCENARIOS), num_rows="dynamic", use_container_width=True,
+                                 key="scenario_editor")
+
+        if st.button("🚀 STRES TESTİNİ ÇALIŞTIR"):
+            try:
+                scenarios = compile_scenarios(scen_df.dropna(subset=['ad']).to_dict('records'))
+            except (ValueError, KeyError, TypeError) as e:
+                st.error(f"Senaryo hatası: {e}")
+            else:
+                kodlar = get_branches()['kod'].tolist() if scope == "Tüm Şubeler" else [scope]
+                parts = fan_out(lambda kod: load_stress_features(kod, STRESS_POPULATIONS[population]), kodlar)
+                features = pd.concat(parts.values(), ignore_index=True)
+                if features.empty:
+                    st.info("Kapsamda model girdisi kayıtlı başvuru bulunmuyor (girdiler yeni başvurularla birlikte "
+                            "kaydedilir).")
+                else:
+                    # Farklı şubelerin kategorileri birleşince object'e döner
+                    features = features.astype({c: 'category' for c in features.select_dtypes(object).columns})
+                    thr = get_db_data("SELECT value FROM settings WHERE key='risk_threshold'").iloc[0]['value']
+                    try:
+                        with st.spinner(f"{len(features):,} başvuru {len(scenarios)} senaryoyla yeniden skorlanıyor..."):
+                            st.session_state['stress_report'] = stress_test(model, preprocessor, load_policy(),
+                                                                            features, thr, scenarios)
+                        log_action(st.session_state['email'], "Stres Testi Çalıştırıldı",
+                                   f"{scope} / {population}: {len(features)} başvuru, {len(scenarios)} senaryo")
+                    except Exception as e:
+                        st.session_state['stress_report'] = None
+                        st.error(f"Stres testi çalıştırılamadı: {e}")
+
+        if st.session_state.get('stress_report') is not None:
+            report = st.session_state['stress_report']
+            st.dataframe(report, hide_index=True, use_container_width=True,
+                         column_config={c: st.column_config.NumberColumn(format="%.1f") for c in
+                                        ["Onay Oranı (%)", "Δ Onay Oranı (puan)", "Ortalama Skor", "Δ Ortalama Skor"]} |
+                                       {c: st.column_config.NumberColumn(format="%d") for c in
+                                        ["Onaylı Hacim (TL)", "Δ Onaylı Hacim (TL)"]})
+            shocked = report.iloc[1:]
+            fig = px.bar(shocked, x='Senaryo', y='Δ Onay Oranı (puan)', color='Δ Onay Oranı (puan)',
+                         color_continuous_scale=['#ef4444', '#22c55e'], hover_data=['Δ Onaylı Hacim (TL)'])
+            fig.update_layout(xaxis_title="", coloraxis_showscale=False)
+            st.plotly_chart(fig, use_container_width=True)
 
     elif sel == "⚙️ Banka Politikası":
         st.title("⚙️ Kredi Risk Politikası Ayarları")
         curr = get_db_data("SELECT value FROM settings WHERE key='risk_threshold'").iloc[0]['value']
-        new_thr = st.slider("Yeni Eşik Değeri", 1000, 1800, int(curr), step=10)
-        if st.button("Politikayı Güncelle"):
-            execute_db("UPDATE settings SET value=? WHERE key='risk_threshold'", (new_thr,))
-            st.success("Güncellendi!");
-            st.rerun()
+        # Eşik ve kurallar tüm şubeler için ortak (merkez veritabanı); sadece bölge yöneticisi değiştirir
+        if is_regional_admin():
+            new_thr = st.slider("Yeni Eşik Değeri", 1000, 1800, int(curr), step=10)
+            if st.button("Politikayı Güncelle"):
+                execute_db("UPDATE settings SET value=? WHERE key='risk_threshold'", (new_thr,))
+                st.success("Güncellendi!");
+                st.rerun()
+        else:
+            st.metric("Onay Eşiği (Banka Geneli)", int(curr))
+            st.caption("Eşik ve karar kuralları banka genelidir; değişiklikler Merkez bölge yöneticisi tarafından yapılır.")
+
+        st.divider()
+        st.subheader("🗄️ Veri Arşivleme")
+        st.caption("Belirtilen günden eski kayıtlar aylık parquet dosyalarına taşınır; raporlar arşivi de okumaya "
+                   "devam eder. Müdür onayı bekleyen dosyalar arşivlenmez.")
+        age = get_db_data("SELECT value FROM settings WHERE key='archive_age_days'").iloc[0]['value']
+        new_age = st.number_input("Arşivleme Yaşı (Gün)", 30, 3650, int(age), step=30)
+        if st.button("Eski Kayıtları Arşivle"):
+            if is_regional_admin():  # Varsayılan yaş merkez ayarıdır; şube müdürü sadece kendi şubesini arşivler
+                execute_db("UPDATE settings SET value=? WHERE key='archive_age_days'", (new_age,))
+            moved = {t: archive_table(branch_db(), t, new_age, archive_dir=shard_archive_dir(current_branch()))
+                     for t in ARCHIVE_TABLES}
+            log_action(st.session_state['email'], "Arşivleme Yapıldı", moved)
+            st.success(f"Arşive taşınan kayıtlar: {moved}")
+
+        st.divider()
+        st.subheader("📜 Hibrit Karar Kuralları")
+        st.caption("Aynı gruptaki kurallardan sıraya göre ilk eşleşen uygulanır. Koşul: [[alan, operatör, değer], ...] "
+                   "(operatörler: ==, !=, >, >=, <, <=, in, not in). 'karar' aşaması toplu sorgu kararını ezer "
+                   "ve 'skor' / 'tutar' alanlarını kullanır.")
+        rules_df = rules_to_frame(get_db_data("SELECT * FROM policy_rules ORDER BY sira").to_dict('records'))
+        if is_regional_admin():
+            edited = st.data_editor(rules_df, num_rows="dynamic", use_container_width=True, key="rule_editor",
+                                    column_config={"asama": st.column_config.SelectboxColumn(options=["skor", "karar"]),
+                                                   "aktif": st.column_config.CheckboxColumn()})
+            if st.button("Kuralları Kaydet"):
+                new_rules = edited.dropna(subset=['kod']).to_dict('records')
+                try:
+                    compile_rules(new_rules)
+                    with sqlite3.connect(CENTRAL_DB) as conn:
+                        save_policy_rules(new_rules, conn)
+                    log_action(st.session_state['email'], "Politika Kuralları Güncellendi", f"{len(new_rules)} kural")
+                    st.success("Kurallar güncellendi!");
+                    st.rerun()
+                except (ValueError, KeyError, TypeError) as e:
+                    st.error(f"Kural hatası: {e}")
+        else:
+            st.dataframe(rules_df, use_container_width=True, hide_index=True)
+
+    elif sel == "📡 Model İzleme":
+        st.title("📡 Skor ve Girdi Dağılımı İzleme")
+        window = st.selectbox("Karşılaştırılan Dönem", list(DRIFT_WINDOWS.keys()))
+        today = datetime.date.today()
+        cur_start = (today - datetime.timedelta(days=DRIFT_WINDOWS[window] - 1)).isoformat()
+        current = load_branch_sketches(start=cur_start)
+
+        reference = load_reference()
+        if reference is not None:
+            st.caption("Referans: drift_referans.json (eğitim verisi veya `python drift_engine.py` ile seçilen veri seti)")
+        else:
+            # Eğitim referansı yoksa karşılaştırılan dönemden önceki tüm kayıtlar referans alınır
+            reference = load_branch_sketches(end=cur_start)
+            st.warning("Eğitim anı referansı (drift_referans.json) bulunamadı; mevcut modelle `python drift_engine.py` "
+                       "ile oluşturulabilir. Şimdilik seçilen dönemden önceki tüm başvurular referans alınıyor.")
+
+        report = drift_report(reference, current)
+        if report.empty:
+            st.info("Karşılaştırma için yeterli veri bulunmuyor.")
+        else:
+            c1, c2, c3 = st.columns(3)
+            c1.metric("Skorlanan Başvuru", f"{int(current['skor'].sum()):,}")
+            c2.metric("Skor PSI", f"{report.set_index('Özellik')['PSI'].get('skor', 0):.3f}")
+            c3.metric("Kayma Uyarısı", int((report['PSI'] >= PSI_WARN).sum()))
+            st.dataframe(report, hide_index=True, use_container_width=True)
+
+            feature = st.selectbox("Dağılım Detayı", report['Özellik'].tolist())
+            ref, cur = reference[feature], current[feature]
+            dist = pd.DataFrame({'Kova': bin_labels(feature) * 2,
+                                 'Oran': np.concatenate([ref / ref.sum(), cur / cur.sum()]),
+                                 'Dağılım': ['Referans'] * len(ref) + [window] * len(cur)})
+            st.plotly_chart(px.bar(dist, x='Kova', y='Oran', color='Dağılım', barmode='group'),
+                            use_container_width=True)
+
+            # Günlük skor PSI'ı: her gün referansla ayrı karşılaştırılır (sadece günlük sayaçlar okunur)
+            daily = load_branch_daily_sketches('skor', (today - datetime.timedelta(days=90)).isoformat())
+            if 'skor' in reference and daily:
+                trend = pd.Series({gun: psi(reference['skor'], c) for gun, c in daily.items()}).sort_index()
+                fig = go.Figure(go.Scatter(x=trend.index, y=trend.values, mode='lines+markers', name='Skor PSI'))
+                fig.add_hline(y=PSI_WARN, line_dash='dot', line_color='#eab308')
+                fig.add_hline(y=PSI_ALERT, line_dash='dot', line_color='#ef4444')
+                fig.update_layout(title="Günlük Skor PSI (Son 90 Gün)", xaxis_title="", yaxis_title="PSI")
+                st.plotly_chart(fig, use_container_width=True)
+
+        st.divider()
+        st.subheader("🔁 Artımlı Model Güncelleme")
+        st.caption("Model mevcut ağırlıklarından devam ederek, son güncellemeden bu yana müdürün karara bağladığı "
+                   "başvuruların saklanan girdi vektörleriyle eğitilir (onay = güvenilir, red = riskli).")
+        kodlar = get_branches()['kod'].tolist()
+        new_labels = sum(fan_out(lambda kod: count_new_labels(shard_path(kod)), kodlar).values())
+        checkpoints = get_db_data("""SELECT id, tarih, uygulandi, kayit_sayisi, onceki_val_loss, val_loss, kullanici,
+            model_path, onceki_model FROM model_checkpoints ORDER BY id DESC""")
+        applied = checkpoints[checkpoints['uygulandi'] == 1]
+        m1, m2 = st.columns(2)
+        m1.metric("Yeni Kararlı Kayıt", f"{new_labels:,}")
+        m2.metric("Son Güncelleme", applied['tarih'].iloc[0] if not applied.empty else "—")
+        if 'fine_tune_msg' in st.session_state:
+            st.success(st.session_state.pop('fine_tune_msg'))
+        if is_regional_admin():  # Model tüm şubelerin ortak modeli
+            if new_labels < MIN_NEW_RECORDS:
+                st.caption(f"Güncelleme için en az {MIN_NEW_RECORDS} yeni müdür kararı gerekir.")
+            elif st.button("🔁 MODELİ YENİ KARARLARLA GÜNCELLE"):
+                with st.spinner(f"{new_labels:,} yeni kayıtla ince ayar yapılıyor..."):
+                    result = fine_tune([shard_path(k) for k in kodlar], CENTRAL_DB, user=st.session_state['email'])
+                log_action(st.session_state['email'], "Model Güncellendi" if result['guncellendi'] else
+                           "Model Güncellemesi Uygulanmadı", result)
+                if result['guncellendi']:
+                    load_assets.clear()  # Yeni model bir sonraki çalıştırmada yüklenir
+                    st.session_state['fine_tune_msg'] = (
+                        f"Model {result['kayit_sayisi']:,} kayıtla güncellendi (doğrulama kaybı "
+                        f"{result['onceki_val_loss']:.4f} → {result['val_loss']:.4f}).")
+                    st.rerun()
+                elif 'val_loss' in result:
+                    st.warning(f"Yeni model doğrulama kaybını iyileştirmedi ({result['onceki_val_loss']:.4f} → "
+                               f"{result['val_loss']:.4f}); mevcut model korundu, kayıtlar sonraki güncellemede "
+                               "tekrar kullanılacak.")
+                elif result.get('tek_sinif'):
+                    st.warning("Yeni kararların eğitim veya doğrulama diliminde onay ve ret birlikte bulunmuyor; "
+                               "model güncellenmedi. Kayıtlar sonraki güncellemede tekrar kullanılacak.")
+                else:
+                    st.info("Model vektör boyutuyla uyumlu yeterli yeni kayıt bulunamadı.")
+        if not checkpoints.empty:
+            st.dataframe(checkpoints, hide_index=True, use_container_width=True)
 
     elif sel == "🛡️ Hareketler":
         st.title("🛡️ Güvenlik ve Denetim Kayıtları")
-        st.dataframe(get_db_data("SELECT * FROM audit_logs ORDER BY timestamp DESC"), use_container_width=True)
+        period = st.selectbox("Dönem", list(PERIODS.keys()))
+        logs = get_table_data('audit_logs', start=period_start(period))
+        st.dataframe(logs.sort_values('timestamp', ascending=False), use_container_width=True)
 
     elif sel == "📝 Kredi Başvurusu":
         st.title("📝 Kredi Tahsis Ekranı")
@@ -484,10 +1228,7 @@ else:
             if tc_c2.button("Müşteri Sorgula"):
                 if len(in_tc) == 11 and in_tc.isdigit():
                     h_tc = get_tc_hash(in_tc)
-                    today = datetime.datetime.now().strftime('%Y-%m-%d')
-                    check = get_db_data("SELECT id FROM credit_history WHERE tc_hash=? AND tarih LIKE ?",
-                                        (h_tc, f"{today}%"))
-                    if not check.empty:
+                    if queried_today(h_tc):
                         st.error("⛔ Sorgu Sınırı: Bu müşteri için bugün zaten sorgulama yapılmış.")
                     else:
                         st.session_state.update({'tc_verified': True, 'active_tc': in_tc, 'analysis_result': None})
@@ -509,7 +1250,7 @@ else:
                     check = st.selectbox("Mevduat", list(maps['checking_account'].keys()))
                     hist = st.selectbox("KKB Geçmişi", list(maps['credit_history'].keys()))
                 with c3:
-                    intr = st.number_input("Faiz (%)", 1.0, 10.0, 3.99)
+                    intr = st.number_input("Faiz (%)", 1.0, 10.0, DEFAULT_INTEREST)
                     sav = st.selectbox("Birikim", list(maps['savings_account'].keys()))
                     prop = st.selectbox("Teminat", list(maps['property'].keys()))
 
@@ -532,9 +1273,12 @@ else:
                                'existing_credits': 1, 'job': maps['job'][job], 'people_liable': 1, 'telephone': 'A192',
                                'foreign_worker': 'A201'}
 
-                        proc = preprocessor.transform(pd.DataFrame([inp]))
+                        inp_df = pd.DataFrame([inp])
+                        proc = preprocessor.transform(inp_df)
                         risk = model.predict(proc, verbose=0)[0][0]
-                        f, msgs = calculate_hybrid_score(int((1 - risk) * 1900), inp)
+                        raw_score = int((1 - risk) * 1900)
+                        record_sketches(branch_db(), sketch_counts(inp_df, [raw_score]))
+                        f, msgs = calculate_hybrid_score(raw_score, inp)
                         xai_res = explain_prediction(model, preprocessor, inp)
                         thr = get_db_data("SELECT value FROM settings WHERE key='risk_threshold'").iloc[0]['value']
 
@@ -548,7 +1292,7 @@ else:
 
                         mp, tp = calculate_payment(amt, dur, intr)
                         add_history(st.session_state['active_tc'], age, amt, dur, f, dec, kredi_durumu,
-                                    st.session_state['name'])
+                                    st.session_state['name'], intr, features=inp, vector=proc)
 
                         st.session_state['analysis_result'] = {
                             'score': f,
@@ -559,7 +1303,10 @@ else:
                             'tp': tp,
                             'xai': xai_res,
                             'amt': amt,
-                            'dur': dur
+                            'dur': dur,
+                            'inp': inp,
+                            'intr': intr,
+                            'thr': thr
                         }
                         st.session_state['tc_verified'] = "DONE"
                         st.rerun()
@@ -612,6 +1359,22 @@ else:
                     fig_xai.update_layout(showlegend=False)
                     st.plotly_chart(fig_xai, use_container_width=True)
 
+                    # Ret/değerlendirme durumunda form tekrar doldurulmadan (günlük sınır harcanmadan) alternatifler
+                    if res['dec'] in ("RED ONERILIR", "DEGERLENDIRILMELI") and 'inp' in res:
+                        st.subheader("🔄 Onay İçin Alternatifler")
+                        if st.button("Alternatifleri Hesapla"):
+                            res['cf'] = find_counterfactuals(model, preprocessor, load_policy(), res['inp'], res['amt'],
+                                                             res['intr'], res['thr'])
+                        if res.get('cf') is not None:
+                            if res['cf'].empty:
+                                st.warning("Tutar ve vadedeki makul, taksiti ödenebilir değişikliklerle onay eşiği "
+                                           "geçilemiyor.")
+                            else:
+                                st.caption(f"Onay eşiği ({int(res['thr'])}) geçen en küçük değişiklikler; taksitler "
+                                           f"%{res['intr']} faizle, borçlanma oranı gelir sabit kabul edilerek "
+                                           "yeni taksite göre hesaplanmıştır. Bu hesaplama kayda geçmez.")
+                                st.dataframe(res['cf'], hide_index=True, use_container_width=True)
+
                 res = st.session_state['analysis_result']
                 if res:
                     pdf_data = {
@@ -639,9 +1402,10 @@ else:
     elif sel == "📋 Başvurularım":
         st.title("📋 Yaptığım Başvurular ve Güncel Durumlar")
         # Sadece giriş yapan personelin ismine göre filtreleme yapıyoruz
-        my_tasks = get_db_data(
-            "SELECT masked_tc, kredi_miktari, vade, risk_skoru, sonuc, durum, tarih FROM credit_history WHERE personel=? ORDER BY tarih DESC",
-            (st.session_state['name'],))
+        my_tasks = get_table_data('credit_history',
+                                  ['masked_tc', 'kredi_miktari', 'vade', 'risk_skoru', 'sonuc', 'durum', 'tarih'],
+                                  filters=[('personel', '==', st.session_state['name'])]
+                                  ).sort_values('tarih', ascending=False)
 
         if not my_tasks.empty:
             st.dataframe(my_tasks, use_container_width=True)
@@ -656,76 +1420,67 @@ else:
 
         if up:
             df_b = pd.read_excel(up)
+            clash = [c for c in RESULT_COLUMNS if c in df_b.columns]
+            if clash:
+                st.error(f"Dosyada sonuç sütunlarıyla aynı adlı sütunlar var ({', '.join(clash)}); "
+                         "bu sütunları silip tekrar yükleyin.")
 
-            if st.button("🚀 ANALİZİ BAŞLAT VE VERİTABANINA KAYDET"):
+            if not clash and st.button("🚀 ANALİZİ BAŞLAT VE VERİTABANINA KAYDET"):
                 p = st.progress(0)
-                scs, decs = [], []
                 thr = get_db_data("SELECT value FROM settings WHERE key='risk_threshold'").iloc[0]['value']
-
-                for i, row in df_b.iterrows():
-                    # --- DÜZELTME 1: Excel'deki 'Tutar (TL)' başlığına göre veriyi al ---
-                    raw_val = row.get('Tutar (TL)') or row.get('Tutar') or row.get('Kredi Tutarı') or 0
-                    current_amt = float(str(raw_val).replace(',', ''))
-
-                    # --- DÜZELTME 2: 'Vade' başlığını kontrol et ---
-                    current_vade = int(row.get('Vade') or row.get('Vade (Ay)') or 24)
-
-                    inp_b = {
-                        'checking_account': maps['checking_account'].get(row.get('Hesap_Durumu'), 'A14'),
-                        'duration': current_vade,
-                        # --- DÜZELTME 3: 'KKB Geçmişi' başlığını kontrol et ---
-                        'credit_history': maps['credit_history'].get(row.get('KKB Geçmişi') or row.get('KKB_Gecmisi'),
-                                                                     'A32'),
-                        'purpose': maps['purpose'].get(row.get('Amac'), 'A40'),
-                        'credit_amount': current_amt / 80,  # DÜZELTME: Buraya da temizlenmiş tutarı koyduk
-                        'savings_account': maps['savings_account'].get(row.get('Birikim'), 'A65'),
-                        'employment': maps['employment'].get(row.get('Kidem'), 'A73'),
-                        'installment_rate': int(row.get('Borclanma_Orani', 2)),
-                        'status_sex': 'A93', 'guarantors': 'A101', 'residence_since': 4,
-                        'property': maps['property'].get(row.get('Teminat'), 'A121'),
-                        'age': int(row.get('Yas') or row.get('Müşteri Yaşı') or 30),
-                        'other_installments': 'A143',
-                        'housing': maps['housing'].get(row.get('Konut'), 'A152'),
-                        'existing_credits': 1,
-                        'job': maps['job'].get(row.get('Meslek'), 'A173'),
-                        'people_liable': 1, 'telephone': 'A191', 'foreign_worker': 'A201'
-                    }
-
-                    try:
-                        proc = preprocessor.transform(pd.DataFrame([inp_b]))
-                        risk = model.predict(proc, verbose=0)[0][0]
-                        f_score, _ = calculate_hybrid_score(int((1 - risk) * 1900), inp_b)
-
-                        k_sonuc = "ONAY" if f_score >= thr else "RED"
-                        if current_amt > 750000 and f_score < 1700:
-                            k_sonuc = "RED (Yüksek Risk)"
-
-                        k_durum = "MÜDÜR ONAYINDA" if current_amt > 500000 else "TAMAMLANDI"
-
-                        scs.append(f_score)
-                        decs.append(k_sonuc)
-
-                        # Veritabanına Kayıt (current_amt artık 0 değil!)
-                        m_tc = str(row.get('TC') or row.get('TCKN') or '00000000000')
-                        add_history(
-                            m_tc,
-                            int(inp_b['age']),
-                            int(current_amt),
-                            current_vade,
-                            f_score,
-                            k_sonuc,
-                            k_durum,
-                            st.session_state['name']  # Müdüre kaydet
-                        )
-
-                    except Exception as e:
-                        scs.append(0)
-                        decs.append("HATA")
-
-                    p.progress((i + 1) / len(df_b))
-
-                df_b['AI_Skor'] = scs
-                df_b['AI_Karar'] = decs
-                st.success(f"✅ {len(df_b)} müşteri başarıyla analiz edildi.")
-                st.dataframe(df_b)
-                st.rerun()  # Grafiğin hemen güncellenmesi için önemli
\ No newline at end of file
+                policy = load_policy()
+
+                # 0) TCKN eleme: geçersiz, dosya içi tekrar ve günlük sınır (skorlanmaz, kaydedilmez)
+                tcs, hashes, reasons = screen_batch_tcs(df_b)
+
+                # 1) Parça parça skorla, kaydet ve sonuç dosyalarına akıt (hatalı satırlar HATA olarak işaretlenir)
+                remove_export(st.session_state.get('batch_export_files'))
+                sweep_stale_exports()  # Çıkış yapmadan sona eren oturumların dosyaları
+                hits, scored = {}, 0
+                with BatchExportWriter(df_b.columns) as writer:
+                    for start in range(0, len(df_b), BATCH_CHUNK_ROWS):
+                        out, chunk_hits, n_ok = score_batch_chunk(df_b.iloc[start:start + BATCH_CHUNK_ROWS], start,
+                                                                  tcs, hashes, reasons, thr, policy)
+                        writer.write(out)
+                        scored += n_ok
+                        for kod, n in chunk_hits.items():
+                            hits[kod] = hits.get(kod, 0) + n
+                        p.progress(min(start + BATCH_CHUNK_ROWS, len(df_b)) / len(df_b))
+                p.progress(1.0)
+                if scored:
+                    st.session_state['batch_rule_hits'] = hits
+                st.session_state['batch_export_files'] = [writer.csv_path, writer.xlsx_path]
+                st.session_state['batch_preview'] = writer.preview
+                st.session_state['batch_rows'] = writer.rows
+
+                rejected = reasons.notna()
+                st.session_state['batch_rejects'] = pd.DataFrame({
+                    'Satır': df_b.index[rejected] + 2,  # Excel satır numarası (başlık 1. satır)
+                    'TCKN': [mask_tc(tc) if len(tc) >= 6 else tc for tc, r in zip(tcs, rejected) if r],
+                    'Neden': reasons[rejected].to_numpy()})
+                st.success(f"✅ {scored} müşteri başarıyla analiz edildi, {int(rejected.sum())} satır atlandı.")
+                st.rerun()  # Grafiğin hemen güncellenmesi için önemli
+
+        if st.session_state.get('batch_preview') is not None:
+            st.subheader("📄 Son Toplu Sorgu Sonuçları")
+            preview = st.session_state['batch_preview']
+            st.caption(f"İlk {len(preview)} / {st.session_state['batch_rows']} satır gösteriliyor; "
+                       "tamamı için sonuç dosyasını indirin.")
+            st.dataframe(preview, hide_index=True, use_container_width=True)
+            csv_path, xlsx_path = st.session_state['batch_export_files']
+            d1, d2 = st.columns(2)
+            if os.path.exists(csv_path):
+                with open(csv_path, 'rb') as f:
+                    d1.download_button("⬇️ CSV İndir", f, file_name="toplu_sorgu_sonuclari.csv", mime="text/csv")
+            if os.path.exists(xlsx_path):
+                with open(xlsx_path, 'rb') as f:
+                    d2.download_button("⬇️ Excel İndir", f, file_name="toplu_sorgu_sonuclari.xlsx",
+                                       mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+
+        if st.session_state.get('batch_rejects') is not None and not st.session_state['batch_rejects'].empty:
+            st.subheader("⛔ Son Toplu Sorguda Atlanan Satırlar")
+            st.dataframe(st.session_state['batch_rejects'], hide_index=True, use_container_width=True)
+
+        if st.session_state.get('batch_rule_hits'):
+            st.subheader("📜 Son Toplu Sorguda Kural İsabetleri")
+            st.table(pd.Series(st.session_state['batch_rule_hits'], name='Eşleşen Başvuru'))
\ No newline at end of file
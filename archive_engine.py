@@ -0,0 +1,206 @@
+import os
+import glob
+import sqlite3
+import datetime
+import numpy as np
+import pandas as pd
+
+ARCHIVE_DIR = 'arsiv'
+DEFAULT_ARCHIVE_AGE_DAYS = 365
+ARCHIVE_CHUNK_ROWS = 100000
+
+# Arşivlenen tablolar: tarih sütunu, tipli parquet şeması ve arşive taşınmayacak satırlar
+ARCHIVE_TABLES = {
+    'credit_history': {
+        'date_col': 'tarih',
+        'keep_hot': "durum = 'MÜDÜR ONAYINDA'",  # Karar bekleyen dosyalar her zaman sıcak tabloda kalır
+        'dtypes': {'id': 'int64', 'masked_tc': 'string', 'tc_hash': 'string', 'musteri_yas': 'Int16',
+                   'kredi_miktari': 'Int64', 'vade': 'Int16', 'risk_skoru': 'Int16', 'sonuc': 'category',
+                   'durum': 'category', 'personel': 'category', 'faiz': 'Float32', 'sube_id': 'category'},
+        # Analitik ekranlar için sıkıştırılmış tipler (boş değer taşımayan sayılar numpy tamsayı)
+        'compact': {'kredi_miktari': 'int32', 'musteri_yas': 'int16', 'vade': 'int16', 'risk_skoru': 'int16',
+                    'faiz': 'float32', 'masked_tc': 'string[pyarrow]', 'tc_hash': 'string[pyarrow]'},
+    },
+    'audit_logs': {
+        'date_col': 'timestamp',
+        'keep_hot': None,
+        'dtypes': {'id': 'int64', 'user': 'category', 'action': 'category', 'details': 'string'},
+        'compact': {'details': 'string[pyarrow]'},
+    },
+    # Tarih sütunu yok: başvurusu (parent) arşive taşınmış satırlar taşınır, arşivleme ayına yazılır.
+    # Eğitimde henüz kullanılmamış müdür kararları sıcak kalır (bkz. feature_store)
+    'credit_features': {
+        'date_col': None,
+        'id_col': 'history_id',
+        'parent': 'credit_history',
+        'keep_hot': "karar IS NOT NULL AND checkpoint_id IS NULL",
+        'dtypes': {'history_id': 'int64', 'karar': 'Int8', 'checkpoint_id': 'Int64'},
+        'compact': {},
+    },
+}
+
+SQL_OPS = {'==': '=', '!=': '!=', '<': '<', '<=': '<=', '>': '>', '>=': '>='}
+
+
+def _fits(col, dtype):
+    # Boş değer veya taşma varsa numpy tamsayıya çevrilmez (astype sessizce taşar)
+    info = np.iinfo(dtype)
+    return not col.hasnans and (col.empty or (info.min <= col.min() and col.max() <= info.max))
+
+
+def _apply_schema(df, table, compact=False):
+    spec = ARCHIVE_TABLES[table]
+    dtypes = {**spec['dtypes'], **spec['compact']} if compact else spec['dtypes']
+    for col, dtype in dtypes.items():
+        if col in df:
+            if compact and col in spec['compact'] and dtype.startswith('int') and not _fits(df[col], dtype):
+                dtype = spec['dtypes'][col]
+            df[col] = df[col].astype(dtype)
+    if spec['date_col'] and spec['date_col'] in df:
+        df[spec['date_col']] = pd.to_datetime(df[spec['date_col']])
+    return df
+
+
+def _partition_dir(table, month, archive_dir):
+    return os.path.join(archive_dir, table, f"ay={month}")
+
+
+def _archive_where(spec, cutoff):
+    if spec['date_col']:
+        where, params = f"{spec['date_col']} < ?", [cutoff]
+    else:
+        where, params = f"{spec['id_col']} NOT IN (SELECT id FROM {spec['parent']})", []
+    if spec['keep_hot']:
+        where += f" AND NOT ({spec['keep_hot']})"
+    return where, params
+
+
+def archive_table(db_path, table, older_than_days=DEFAULT_ARCHIVE_AGE_DAYS, archive_dir=ARCHIVE_DIR, now=None,
+                  chunk_rows=ARCHIVE_CHUNK_ROWS):
+    """older_than_days günden eski satırları aylık parquet bölümlerine taşır ve SQLite'tan siler.
+    Her parça önce dosyaya yazılır, sonra silinir ve hemen işlenir (commit); yarıda kalan bir çalışma veri
+    kaybettirmez, iki katmanda birden kalan en fazla bir parça da sonraki çalışmada sıcak tablodan silinir.
+    Taşınan satır sayısını döner."""
+    spec = ARCHIVE_TABLES[table]
+    date_col, id_col = spec['date_col'], spec.get('id_col', 'id')
+    now = now or datetime.datetime.now()
+    cutoff = (now - datetime.timedelta(days=older_than_days)).strftime('%Y-%m-%d %H:%M:%S')
+    where, params = _archive_where(spec, cutoff)
+    # Önceki yarım kalmış çalışmanın dosyası yazılmış ama silinmemiş satırları
+    archived = read_cold(table, [id_col], archive_dir=archive_dir)
+    archived = archived[id_col].to_numpy() if not archived.empty else np.zeros(0, dtype=np.int64)
+
+    moved, last_id = 0, -1
+    with sqlite3.connect(db_path) as conn:
+        while True:
+            chunk = pd.read_sql_query(f"SELECT * FROM {table} WHERE {where} AND {id_col} > ? ORDER BY {id_col} "
+                                      f"LIMIT ?", conn, params=(*params, last_id, chunk_rows))
+            if chunk.empty:
+                break
+            last_id = int(chunk[id_col].iloc[-1])
+            chunk = _apply_schema(chunk, table)
+            new = chunk[~chunk[id_col].isin(archived)]
+            months = new[date_col].dt.strftime('%Y-%m') if date_col else pd.Series(f"{now:%Y-%m}", index=new.index)
+            for month, part in new.groupby(months):
+                out_dir = _partition_dir(table, month, archive_dir)
+                os.makedirs(out_dir, exist_ok=True)
+                path = os.path.join(out_dir, f"part-{part[id_col].min()}-{part[id_col].max()}.parquet")
+                part.to_parquet(path + '.tmp', engine='pyarrow', compression='zstd', index=False)
+                os.replace(path + '.tmp', path)
+            conn.executemany(f"DELETE FROM {table} WHERE {id_col}=?", [(int(i),) for i in chunk[id_col]])
+            conn.commit()
+            moved += len(new)
+    if moved:
+        # Silinen sayfaları diske geri vermek için (işlem dışında çalışmalı)
+        with sqlite3.connect(db_path, isolation_level=None) as conn:
+            conn.execute("VACUUM")
+    return moved
+
+
+def _months_overlapping(table, start, end, archive_dir):
+    """Tarih aralığıyla kesişen ay bölümleri (bölüm budama)."""
+    parts = []
+    for d in sorted(glob.glob(os.path.join(archive_dir, table, 'ay=*'))):
+        month_start = pd.Timestamp(os.path.basename(d)[3:] + '-01')
+        month_end = month_start + pd.offsets.MonthBegin(1)
+        if (start is None or month_end > pd.Timestamp(start)) and (end is None or month_start < pd.Timestamp(end)):
+            parts.append(d)
+    return parts
+
+
+def read_cold(table, columns=None, start=None, end=None, filters=None, archive_dir=ARCHIVE_DIR):
+    """Arşivdeki parquet bölümlerini okur. Sadece istenen sütunlar ve tarih aralığıyla kesişen aylar okunur.
+    filters: [(sütun, operatör, değer), ...] (operatörler: ==, !=, <, <=, >, >=, in)"""
+    date_col = ARCHIVE_TABLES[table]['date_col']
+    if date_col is None:  # Tarihsiz tablolarda aralık uygulanmaz, tüm bölümler okunur
+        start = end = None
+    pa_filters = [tuple(f) for f in (filters or [])]
+    if start is not None:
+        pa_filters.append((date_col, '>=', pd.Timestamp(start)))
+    if end is not None:
+        pa_filters.append((date_col, '<', pd.Timestamp(end)))
+
+    frames = []
+    for d in _months_overlapping(table, start, end, archive_dir):
+        for f in sorted(glob.glob(os.path.join(d, '*.parquet'))):
+            frames.append(pd.read_parquet(f, engine='pyarrow', columns=columns, filters=pa_filters or None))
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame(columns=columns or [])
+    return pd.concat(frames, ignore_index=True)
+
+
+def _sql_where(filters, date_col, start, end):
+    clauses, params = [], []
+    for col, op, val in filters or []:
+        if op == 'in':
+            clauses.append(f"{col} IN ({','.join('?' * len(val))})")
+            params.extend(val)
+        else:
+            clauses.append(f"{col} {SQL_OPS[op]} ?")
+            params.append(val)
+    if start is not None:
+        clauses.append(f"{date_col} >= ?")
+        params.append(pd.Timestamp(start).strftime('%Y-%m-%d %H:%M:%S'))
+    if end is not None:
+        clauses.append(f"{date_col} < ?")
+        params.append(pd.Timestamp(end).strftime('%Y-%m-%d %H:%M:%S'))
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def frame_memory_mb(df):
+    """DataFrame'in gerçek bellek kullanımı (metin içerikleri dahil), MB."""
+    return df.memory_usage(deep=True).sum() / 2 ** 20
+
+
+def read_table(db_path, table, columns=None, start=None, end=None, filters=None, archive_dir=ARCHIVE_DIR,
+               compact=False):
+    """Sıcak (SQLite) ve soğuk (parquet) katmanı tek tablo gibi okur; aynı filtreler iki katmana da uygulanır.
+    compact: metinler kategorik/pyarrow, sayılar 32/16 bit (analitik ekranlar için, bkz. ARCHIVE_TABLES['compact'])"""
+    date_col = ARCHIVE_TABLES[table]['date_col']
+    where, params = _sql_where(filters, date_col, start, end)
+    with sqlite3.connect(db_path) as conn:
+        hot = pd.read_sql_query(f"SELECT {', '.join(columns) if columns else '*'} FROM {table}{where}", conn,
+                                params=params)
+    cold = read_cold(table, columns, start, end, filters, archive_dir)
+    if cold.empty:
+        return _apply_schema(hot, table, compact)
+    df = pd.concat([_apply_schema(cold, table, compact), _apply_schema(hot, table, compact)], ignore_index=True)
+    if 'id' in df:
+        # Dosyası yazılıp silinmesi yarıda kalmış satırlar iki katmanda birden olabilir
+        df = df.drop_duplicates(subset='id', keep='last')
+    # Kategori kümeleri farklı iki kategorik sütun birleşince object'e döner; şema yeniden uygulanır
+    return _apply_schema(df, table, compact)
+
+
+if __name__ == '__main__':
+    # Zamanlanmış görev olarak: python archive_engine.py [gün]
+    import sys
+    from shard_engine import CENTRAL_DB, shard_path, shard_archive_dir
+    with sqlite3.connect(CENTRAL_DB) as conn:
+        kodlar = [r[0] for r in conn.execute("SELECT kod FROM branches").fetchall()]
+        age = conn.execute("SELECT value FROM settings WHERE key='archive_age_days'").fetchone()
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else int(age[0] if age else DEFAULT_ARCHIVE_AGE_DAYS)
+    for kod in kodlar:
+        print(kod, {t: archive_table(shard_path(kod), t, days, archive_dir=shard_archive_dir(kod))
+                    for t in ARCHIVE_TABLES})
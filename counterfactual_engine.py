@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+from rule_engine import apply_score_rules
+from portfolio_engine import annuity_payment
+
+MODEL_SCALE_FACTOR = 80  # Model TL/80 ölçeğinde eğitildi (bkz. kredi formu)
+AMOUNT_FRACTIONS = np.round(np.arange(1.0, 0.275, -0.05), 2)  # İstenen tutarın %100'ünden %30'una, %5 adımla
+DURATION_STEP = 6  # Vade değişimi 6 aylık adımlarla
+MAX_DURATION_CHANGE = 0.5  # İstenen vadenin en fazla ±%50'si (en az bir adım)
+MIN_RATE, MAX_RATE = 1, 4  # Borçlanma oranı (taksit/gelir) kodları
+AMOUNT_ROUNDING = 1000  # Önerilen tutarlar bin TL'ye aşağı yuvarlanır
+MIN_AMOUNT, MIN_DURATION, MAX_DURATION = 5000, 3, 120  # Kredi formundaki sınırlar
+# Değişiklik maliyeti "adım" cinsinden: %5 tutar = 6 ay vade
+STEP_AMOUNT = 0.05
+
+
+def candidate_grid(amount, duration, installment_rate, interest):
+    """Başvurunun çevresindeki tutar x vade kombinasyonları (tekrarsız, form sınırları içinde).
+    Borçlanma oranı serbest bir seçenek değildir: gelir sabit kabul edilir ve oran yeni taksitin mevcut taksite
+    oranıyla ölçeklenir. En yüksek oran kodunu (4) aşan, yani ödenemeyecek adaylar elenir."""
+    amounts = np.maximum(np.floor(amount * AMOUNT_FRACTIONS / AMOUNT_ROUNDING) * AMOUNT_ROUNDING, MIN_AMOUNT)
+    amounts[0] = amount  # Mevcut tutar yuvarlanmaz
+    reach = max(DURATION_STEP, int(duration * MAX_DURATION_CHANGE) // DURATION_STEP * DURATION_STEP)
+    durations = np.clip(duration + np.arange(-reach, reach + 1, DURATION_STEP), MIN_DURATION, MAX_DURATION)
+    a, d = np.meshgrid(np.unique(amounts), np.unique(durations), indexing='ij')
+    grid = pd.DataFrame({'tutar': a.ravel(), 'vade': d.ravel()})
+
+    ratio = annuity_payment(grid['tutar'], grid['vade'], np.full(len(grid), interest)) / annuity_payment(
+        [amount], [duration], [interest])[0]
+    rate = installment_rate * ratio
+    grid['borclanma'] = np.clip(np.round(rate), MIN_RATE, MAX_RATE).astype(int)
+    return grid[rate <= MAX_RATE].reset_index(drop=True)
+
+
+def _change_steps(grid, amount, duration):
+    # Aday başına (tutar azalışı, vade değişimi) adım cinsinden
+    return np.column_stack([(amount - grid['tutar'].to_numpy()) / amount / STEP_AMOUNT,
+                            (grid['vade'].to_numpy() - duration) / DURATION_STEP])
+
+
+def _pareto_minimal(steps):
+    """Başka bir geçen adayın aynı yönde ve her boyutta daha küçük değişikliğiyle sağlanabilen adayları eler."""
+    mag, sign = np.abs(steps), np.sign(steps)
+    # [i, j]: j adayı, i ile aynı yönde ve i'den kesin olarak daha küçük bir değişiklik
+    same_dir = ((sign[:, None, :] == sign[None, :, :]) | (mag[None, :, :] == 0)).all(axis=2)
+    smaller = (mag[None, :, :] <= mag[:, None, :]).all(axis=2) & (mag[None, :, :] < mag[:, None, :]).any(axis=2)
+    return ~(same_dir & smaller).any(axis=1)
+
+
+def find_counterfactuals(model, preprocessor, policy, inp, amount, interest, threshold, top_k=5,
+                         scale=MODEL_SCALE_FACTOR):
+    """Başvurunun onay eşiğini geçmesi için gereken en küçük tutar/vade değişikliklerini bulur.
+    Tüm aday ızgara tek model çağrısında skorlanır; karar, sonuç panelindeki gibi skor kuralları sonrası
+    skorun eşikle karşılaştırılmasıdır. inp: kredi formunun model girdisi sözlüğü, amount: TL tutar.
+    Dönüş: en fazla top_k öneri (en az değişiklik önce); hiçbir aday eşiği geçemiyorsa boş tablo."""
+    duration, rate = int(inp['duration']), int(inp['installment_rate'])
+    grid = candidate_grid(amount, duration, rate, interest)
+
+    features = pd.DataFrame([inp] * len(grid))
+    features['credit_amount'] = grid['tutar'] / scale
+    features['duration'] = grid['vade']
+    features['installment_rate'] = grid['borclanma']
+    risk = model.predict(preprocessor.transform(features), verbose=0)[:, 0]
+    scores, _, _ = apply_score_rules(policy, ((1 - risk) * 1900).astype(int), features)
+
+    passed = scores >= threshold
+    steps = _change_steps(grid, amount, duration)
+    grid, steps, scores = grid[passed].reset_index(drop=True), steps[passed], scores[passed]
+    keep = _pareto_minimal(steps)
+    out = grid[keep].assign(skor=scores[keep], maliyet=np.abs(steps[keep]).sum(axis=1),
+                            degisen=(steps[keep] != 0).sum(axis=1))
+    out = out.sort_values(['maliyet', 'degisen', 'skor'], ascending=[True, True, False]).head(top_k)
+
+    payment = annuity_payment(out['tutar'], out['vade'], np.full(len(out), interest))
+    return pd.DataFrame({
+        'Tutar (TL)': out['tutar'].astype(int).to_numpy(),
+        'Vade (Ay)': out['vade'].to_numpy(),
+        'Borçlanma Oranı': out['borclanma'].to_numpy(),
+        'Skor': out['skor'].to_numpy(),
+        'Aylık Taksit (TL)': np.round(payment, 2),
+        'Toplam Ödeme (TL)': np.round(payment * out['vade'].to_numpy(), 2),
+        'Değişiklik': [describe_change(amount, duration, rate, r.tutar, r.vade, r.borclanma)
+                       for r in out.itertuples()],
+    })
+
+
+def describe_change(amount, duration, rate, new_amount, new_duration, new_rate):
+    parts = []
+    if new_amount != amount:
+        parts.append(f"Tutar {amount:,.0f} → {new_amount:,.0f} TL (-%{(1 - new_amount / amount) * 100:.0f})")
+    if new_duration != duration:
+        parts.append(f"Vade {duration} → {new_duration} ay")
+    if new_rate != rate:
+        parts.append(f"Borçlanma oranı {rate} → {new_rate}")
+    return ", ".join(parts) or "Değişiklik gerekmez"
@@ -0,0 +1,198 @@
+import os
+import json
+import sqlite3
+import datetime
+import numpy as np
+import pandas as pd
+from feature_store import FEATURE_COLUMNS
+
+REFERENCE_PATH = 'drift_referans.json'  # main.py eğitim sonunda veya `python drift_engine.py` ile yazılır
+TRAINING_DATA_URL = "https://archive.ics.uci.edu/ml/machine-learning-databases/statlog/german/german.data"
+PSI_WARN, PSI_ALERT = 0.1, 0.25  # Yaygın PSI eşikleri: <0.1 stabil, 0.1-0.25 izlenmeli, >0.25 belirgin kayma
+PSI_EPS = 1e-4  # Boş kovalarda log(0) olmaması için alt sınır
+
+# Sabit kova sınırları: her başvuru bir özellik için tek bir kovayı bir artırır (başvuru başına O(1)).
+# Sayısal özelliklerde iç kesim noktaları verilir; uçlardaki değerler ilk/son kovaya düşer.
+NUMERIC_SKETCHES = {
+    'skor': list(range(100, 1900, 100)),  # Modelin ham skoru (kurallar uygulanmadan), 0-1900
+    'credit_amount': [500, 1000, 1500, 2000, 2500, 3000, 4000, 5000, 7500, 10000, 15000],  # Model ölçeği (TL/80)
+    'duration': [6, 12, 18, 24, 30, 36, 48, 60],
+    'age': [25, 30, 35, 40, 45, 50, 60, 70],
+    'installment_rate': [2, 3, 4],
+}
+# Kategorik özelliklerde listede olmayan kodlar son "Diğer" kovasına sayılır
+CATEGORICAL_SKETCHES = {
+    'credit_history': ['A30', 'A31', 'A32', 'A33', 'A34'],
+    'checking_account': ['A11', 'A12', 'A13', 'A14'],
+    'savings_account': ['A61', 'A62', 'A63', 'A64', 'A65'],
+    'employment': ['A71', 'A72', 'A73', 'A74', 'A75'],
+    'purpose': ['A40', 'A41', 'A42', 'A43', 'A44', 'A45', 'A46', 'A48', 'A49', 'A410'],
+    'job': ['A171', 'A172', 'A173', 'A174'],
+    'housing': ['A151', 'A152', 'A153'],
+}
+
+
+# Gün x özellik x kova sayaçları; her şubenin kendi parçasında tutulur, okurken şubeler toplanır
+DRIFT_TABLE_SQL = '''CREATE TABLE IF NOT EXISTS drift_sketches (
+    gun TEXT, ozellik TEXT, kova INTEGER, adet INTEGER, PRIMARY KEY (gun, ozellik, kova))'''
+
+
+def bin_labels(ozellik):
+    if ozellik in NUMERIC_SKETCHES:
+        cuts = NUMERIC_SKETCHES[ozellik]
+        return [f"<{cuts[0]}"] + [f"{a}-{b}" for a, b in zip(cuts, cuts[1:])] + [f"≥{cuts[-1]}"]
+    return CATEGORICAL_SKETCHES[ozellik] + ['Diğer']
+
+
+def sketch_counts(features, raw_scores):
+    """Bir grup başvurunun kova sayıları: {özellik: sayaç dizisi}.
+    features: model girdisi sütunlarını içeren DataFrame (tekil başvuruda tek satır)."""
+    columns = {'skor': np.asarray(raw_scores, dtype=np.float64)}
+    counts = {}
+    for ozellik, cuts in NUMERIC_SKETCHES.items():
+        values = columns['skor'] if ozellik == 'skor' else np.asarray(features[ozellik], dtype=np.float64)
+        counts[ozellik] = np.bincount(np.searchsorted(cuts, values, side='right'), minlength=len(cuts) + 1)
+    for ozellik, cats in CATEGORICAL_SKETCHES.items():
+        codes = pd.Categorical(np.asarray(features[ozellik], dtype=object), categories=cats).codes
+        counts[ozellik] = np.bincount(np.where(codes < 0, len(cats), codes), minlength=len(cats) + 1)
+    return counts
+
+
+def record_sketches(db_path, counts, day=None):
+    """Günlük sayaçları artırır (UPSERT); sadece dolu kovalar yazılır, tüm tablo hiç okunmaz."""
+    gun = day or datetime.date.today().isoformat()
+    rows = [(gun, ozellik, int(k), int(arr[k])) for ozellik, arr in counts.items() for k in np.flatnonzero(arr)]
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany("""INSERT INTO drift_sketches (gun, ozellik, kova, adet) VALUES (?, ?, ?, ?)
+            ON CONFLICT(gun, ozellik, kova) DO UPDATE SET adet = adet + excluded.adet""", rows)
+
+
+def _to_counts(df):
+    counts = {}
+    for ozellik, grp in df.groupby('ozellik'):
+        if ozellik not in NUMERIC_SKETCHES and ozellik not in CATEGORICAL_SKETCHES:
+            continue
+        arr = np.zeros(len(bin_labels(ozellik)), dtype=np.int64)
+        kova, adet = grp['kova'].to_numpy(), grp['adet'].to_numpy()
+        keep = kova < len(arr)  # Kova tanımı daraltılmışsa eski fazla kovalar yok sayılır
+        arr[kova[keep]] = adet[keep]
+        counts[ozellik] = arr
+    return counts
+
+
+def load_sketches(db_path, start=None, end=None):
+    """[start, end) günlerinin sayaçlarını toplar (gün ISO metni). Dönüş: {özellik: sayaç dizisi}"""
+    clauses, params = [], []
+    if start is not None:
+        clauses.append("gun >= ?")
+        params.append(start)
+    if end is not None:
+        clauses.append("gun < ?")
+        params.append(end)
+    where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+    with sqlite3.connect(db_path) as conn:
+        df = pd.read_sql_query(f"SELECT ozellik, kova, SUM(adet) AS adet FROM drift_sketches{where} "
+                               "GROUP BY ozellik, kova", conn, params=params)
+    return _to_counts(df)
+
+
+def merge_counts(parts):
+    """Şube parçalarından okunan {özellik: sayaç dizisi} sözlüklerini toplar."""
+    merged = {}
+    for counts in parts:
+        for ozellik, arr in counts.items():
+            merged[ozellik] = merged[ozellik] + arr if ozellik in merged else arr.copy()
+    return merged
+
+
+def load_daily_sketches(db_path, ozellik, start=None):
+    """Bir özelliğin gün bazında sayaçları. Dönüş: {gün: sayaç dizisi}"""
+    with sqlite3.connect(db_path) as conn:
+        df = pd.read_sql_query("SELECT gun, ozellik, kova, adet FROM drift_sketches WHERE ozellik = ? AND gun >= ?",
+                               conn, params=(ozellik, start or ''))
+    return {gun: _to_counts(grp)[ozellik] for gun, grp in df.groupby('gun')}
+
+
+def psi(reference, current, eps=PSI_EPS):
+    """Population Stability Index: sum (q - p) * ln(q / p)"""
+    p = np.maximum(np.asarray(reference, dtype=np.float64) / max(np.sum(reference), 1), eps)
+    q = np.maximum(np.asarray(current, dtype=np.float64) / max(np.sum(current), 1), eps)
+    return float(np.sum((q - p) * np.log(q / p)))
+
+
+def ks_statistic(reference, current):
+    """Kovalanmış dağılımlar arasında Kolmogorov-Smirnov D istatistiği (kümülatif oranların en büyük farkı)."""
+    p = np.cumsum(reference) / max(np.sum(reference), 1)
+    q = np.cumsum(current) / max(np.sum(current), 1)
+    return float(np.max(np.abs(p - q)))
+
+
+def drift_status(value):
+    if value >= PSI_ALERT:
+        return "🔴 Belirgin Kayma"
+    if value >= PSI_WARN:
+        return "🟡 İzlenmeli"
+    return "🟢 Stabil"
+
+
+def drift_report(reference, current):
+    """Referans ve güncel sayaçlardan özellik bazında PSI/KS tablosu. KS sadece sıralı (sayısal) özelliklerde anlamlı."""
+    rows = []
+    for ozellik in list(NUMERIC_SKETCHES) + list(CATEGORICAL_SKETCHES):
+        ref, cur = reference.get(ozellik), current.get(ozellik)
+        if ref is None or cur is None or len(ref) != len(cur) or not np.sum(ref) or not np.sum(cur):
+            continue  # Kova tanımı değişmiş (eski referans dosyası) veya veri yok
+        value = psi(ref, cur)
+        rows.append({'Özellik': ozellik, 'Referans Adet': int(np.sum(ref)), 'Güncel Adet': int(np.sum(cur)),
+                     'PSI': round(value, 4),
+                     'KS': round(ks_statistic(ref, cur), 4) if ozellik in NUMERIC_SKETCHES else None,
+                     'Durum': drift_status(value)})
+    return pd.DataFrame(rows)
+
+
+def build_reference(features, raw_scores):
+    """Eğitim verisi ve modelin bu veri üzerindeki ham skorlarından referans sayaçları."""
+    return {ozellik: arr.tolist() for ozellik, arr in sketch_counts(features, raw_scores).items()}
+
+
+def save_reference(reference, path=REFERENCE_PATH):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'olusturma': datetime.datetime.now().isoformat(timespec='seconds'), 'sketches': reference}, f)
+
+
+def load_reference(path=REFERENCE_PATH):
+    """Eğitim anı referansı; dosya yoksa None."""
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return {ozellik: np.asarray(v, dtype=np.int64) for ozellik, v in data['sketches'].items()}
+
+
+def reference_from_model(model, preprocessor, features):
+    """Mevcut modelin (ince ayarlı olabilir) verilen model girdileri üzerindeki ham skorlarıyla referans sayaçları."""
+    raw_scores = ((1 - model.predict(preprocessor.transform(features), verbose=0)[:, 0]) * 1900).astype(int)
+    return build_reference(features, raw_scores)
+
+
+def load_training_split():
+    """main.py'nin eğitim kümesi (aynı veri ve aynı ayırma), modeli yeniden eğitmeden referans üretmek için."""
+    from sklearn.model_selection import train_test_split
+    df = pd.read_csv(TRAINING_DATA_URL, sep=' ', names=list(FEATURE_COLUMNS) + ['risk'])
+    X_train, _, _, _ = train_test_split(df[list(FEATURE_COLUMNS)], df['risk'], test_size=0.2, random_state=42,
+                                        stratify=df['risk'])
+    return X_train
+
+
+if __name__ == '__main__':
+    # Referansı mevcut modelle yeniden üretir (main.py gibi modeli yeniden eğitip üzerine yazmaz):
+    #   python drift_engine.py            -> main.py'nin eğitim kümesi
+    #   python drift_engine.py veri.csv   -> model girdisi sütunlarını içeren başka bir veri seti
+    import sys
+    import joblib
+    import tensorflow as tf
+    from training_engine import MODEL_PATH
+    data = pd.read_csv(sys.argv[1]) if len(sys.argv) > 1 else load_training_split()
+    model = tf.keras.models.load_model(MODEL_PATH)
+    save_reference(reference_from_model(model, joblib.load('veri_isleyici.pkl'), data[list(FEATURE_COLUMNS)]))
+    print(f"✅ Kayma izleme referansı kaydedildi: {REFERENCE_PATH} ({len(data):,} kayıt)")
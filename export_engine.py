@@ -0,0 +1,106 @@
+import os
+import csv
+import time
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+PREVIEW_ROWS = 200  # Tarayıcıya gönderilen en fazla satır
+XLSX_MAX_ROWS = 1048576  # Excel sayfa sınırı (başlık dahil); aşılırsa yeni sayfaya geçilir
+RESULT_COLUMNS = ['AI_Skor', 'AI_Karar', 'AI_Durum', 'Kural_Mesajlari', 'Ret_Nedeni']
+EXPORT_PREFIX = 'bankflow_toplu_'
+EXPORT_MAX_AGE_HOURS = 6  # Çıkış yapılmadan sona eren oturumların dosyaları (açık TCKN içerir) bu süreden sonra silinir
+
+
+def _cell(v):
+    # xlsxwriter numpy/pandas tiplerini tanımaz; boş hücreler yazılmaz
+    if v is None or v is pd.NA or v is pd.NaT or (isinstance(v, float) and np.isnan(v)):
+        return None
+    if isinstance(v, np.generic):
+        return v.item()
+    if isinstance(v, (pd.Timestamp, np.datetime64)):
+        return str(v)
+    return v
+
+
+class BatchExportWriter:
+    """Toplu sorgu sonuçlarını skorlama ilerledikçe parça parça CSV ve XLSX dosyalarına yazar.
+    XLSX sabit bellek kipinde (satırlar diske akıtılır) yazılır; bellekte sadece ilk preview_rows satır tutulur."""
+
+    def __init__(self, columns, out_dir=None, preview_rows=PREVIEW_ROWS):
+        clash = [c for c in RESULT_COLUMNS if c in list(columns)]
+        if clash:
+            raise ValueError(f"Yüklenen dosyada sonuç sütunlarıyla aynı adlı sütunlar var: {', '.join(clash)}")
+        self.columns = list(columns) + RESULT_COLUMNS
+        self.preview_rows = preview_rows
+        self.preview = pd.DataFrame(columns=self.columns)
+        self.rows = 0
+        base = tempfile.mkdtemp(prefix=EXPORT_PREFIX, dir=out_dir)
+        self.csv_path = os.path.join(base, 'toplu_sorgu_sonuclari.csv')
+        self.xlsx_path = os.path.join(base, 'toplu_sorgu_sonuclari.xlsx')
+
+        # utf-8-sig: Excel'in Türkçe karakterleri doğru açması için BOM
+        self._csv = open(self.csv_path, 'w', encoding='utf-8-sig', newline='')
+        csv.writer(self._csv).writerow(self.columns)  # Virgül/tırnak içeren başlıklar satırlarla aynı kurala göre
+        self._wb = xlsxwriter.Workbook(self.xlsx_path, {'constant_memory': True})
+        self._ws, self._ws_row = None, XLSX_MAX_ROWS
+
+    def _new_sheet(self):
+        self._ws = self._wb.add_worksheet(f"Sonuçlar{len(self._wb.worksheets()) + 1 if self._ws else ''}")
+        self._ws.write_row(0, 0, self.columns)
+        self._ws_row = 1
+
+    def write(self, chunk):
+        chunk = chunk.reindex(columns=self.columns)
+        chunk.to_csv(self._csv, index=False, header=False)
+        for values in chunk.itertuples(index=False, name=None):
+            if self._ws_row >= XLSX_MAX_ROWS:
+                self._new_sheet()
+            self._ws.write_row(self._ws_row, 0, [_cell(v) for v in values])
+            self._ws_row += 1
+        if len(self.preview) < self.preview_rows:
+            head = chunk.head(self.preview_rows - len(self.preview))
+            self.preview = head if self.preview.empty else pd.concat([self.preview, head], ignore_index=True)
+        self.rows += len(chunk)
+
+    def close(self):
+        if self._ws is None:
+            self._new_sheet()  # Boş sonuçta da başlıklı geçerli bir dosya üretilir
+        self._csv.close()
+        self._wb.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def remove_export(paths):
+    """Önceki toplu sorgunun geçici dosyalarını siler."""
+    for path in paths or []:
+        if path and os.path.exists(path):
+            os.remove(path)
+    dirs = {os.path.dirname(p) for p in paths or [] if p}
+    for d in dirs:
+        if os.path.isdir(d) and not os.listdir(d):
+            os.rmdir(d)
+
+
+def sweep_stale_exports(out_dir=None, max_age_hours=EXPORT_MAX_AGE_HOURS):
+    """max_age_hours'tan eski toplu sorgu klasörlerini siler (sahibi oturum Çıkış yapmadan sona ermiş olanlar).
+    Silinen klasör sayısını döner."""
+    base = out_dir or tempfile.gettempdir()
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
+    for name in os.listdir(base):
+        path = os.path.join(base, name)
+        try:
+            if name.startswith(EXPORT_PREFIX) and os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path)
+                removed += 1
+        except OSError:
+            pass  # Başka bir süreç aynı anda silmiş olabilir
+    return removed
@@ -0,0 +1,93 @@
+import sqlite3
+import numpy as np
+import pandas as pd
+from archive_engine import read_cold
+
+# Modelin 20 girdisi (main.py'deki eğitim sırası) ve SQLite tipleri; credit_amount model ölçeğindedir (TL/80)
+FEATURE_COLUMNS = {
+    'checking_account': 'TEXT', 'duration': 'INTEGER', 'credit_history': 'TEXT', 'purpose': 'TEXT',
+    'credit_amount': 'REAL', 'savings_account': 'TEXT', 'employment': 'TEXT', 'installment_rate': 'INTEGER',
+    'status_sex': 'TEXT', 'guarantors': 'TEXT', 'residence_since': 'INTEGER', 'property': 'TEXT', 'age': 'INTEGER',
+    'other_installments': 'TEXT', 'housing': 'TEXT', 'existing_credits': 'INTEGER', 'job': 'TEXT',
+    'people_liable': 'INTEGER', 'telephone': 'TEXT', 'foreign_worker': 'TEXT',
+}
+
+# Skorlanan her başvurunun model girdisi; credit_history satırına history_id ile bağlanır (şube parçasında tutulur).
+# Arşivleme sadece credit_history'yi taşır, bu tablo sıcak kalır.
+FEATURES_TABLE_SQL = (f"CREATE TABLE IF NOT EXISTS credit_features (history_id INTEGER PRIMARY KEY, "
+                      f"{', '.join(f'{c} {t}' for c, t in FEATURE_COLUMNS.items())})")
+# Eğitim için ek sütunlar (eski tablolara göç ile eklenir):
+# vektor: ön işleyici çıktısı float32 bayt dizisi, karar: müdürün nihai kararı (1 = red/riskli, 0 = onay),
+# checkpoint_id: kaydın kullanıldığı ince ayar (NULL = henüz eğitimde kullanılmadı)
+TRAINING_COLUMNS = {'vektor': 'BLOB', 'karar': 'INTEGER', 'karar_tarihi': 'TIMESTAMP', 'checkpoint_id': 'INTEGER'}
+# Sadece karar verilmiş ve henüz kullanılmamış kayıtlar; eğitim sorgusu tabloyu taramaz
+TRAINING_INDEX_SQL = ("CREATE INDEX IF NOT EXISTS idx_credit_features_yeni ON credit_features (history_id) "
+                      "WHERE karar IS NOT NULL AND checkpoint_id IS NULL")
+FEATURES_INSERT = (f"INSERT OR REPLACE INTO credit_features (history_id, {', '.join(FEATURE_COLUMNS)}, vektor) "
+                   f"VALUES ({', '.join('?' * (len(FEATURE_COLUMNS) + 2))})")
+
+
+def save_features(conn, history_ids, features, vectors=None):
+    """features: model girdisi sütunlarını içeren DataFrame (history_ids ile aynı sırada).
+    vectors: aynı satırların ön işleyici çıktısı (float32 olarak saklanır). Açık bağlantıda yazar;
+    credit_history kaydıyla aynı işlemde kalır."""
+    values = features[list(FEATURE_COLUMNS)].astype(object).to_numpy().tolist()
+    blobs = [None] * len(values) if vectors is None else [v.tobytes() for v in np.asarray(vectors, dtype=np.float32)]
+    conn.executemany(FEATURES_INSERT, [(int(i), *v, b) for i, v, b in zip(history_ids, values, blobs)])
+
+
+def set_decisions(conn, history_ids, approved):
+    """Müdür kararını eğitim etiketi olarak işler (onay = 0, red = 1)."""
+    conn.executemany("UPDATE credit_features SET karar=?, karar_tarihi=CURRENT_TIMESTAMP WHERE history_id=?",
+                     [(0 if approved else 1, int(i)) for i in history_ids])
+
+
+NEW_LABELS_WHERE = "karar IS NOT NULL AND checkpoint_id IS NULL AND vektor IS NOT NULL"
+
+
+def count_new_labels(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM credit_features WHERE {NEW_LABELS_WHERE}").fetchone()[0]
+
+
+def load_training_vectors(db_path, dim):
+    """Karar verilmiş ve henüz hiçbir ince ayarda kullanılmamış kayıtlar, karar sırasıyla.
+    Dönüş: (history_id, karar_tarihi, X float32, y)
+    dim: modelin girdi boyutu; farklı bir ön işleyiciyle kodlanmış eski vektörler atlanır."""
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute(f"SELECT history_id, COALESCE(karar_tarihi, ''), vektor, karar FROM credit_features "
+                            f"WHERE {NEW_LABELS_WHERE} AND length(vektor) = ? ORDER BY karar_tarihi, history_id",
+                            (dim * 4,)).fetchall()
+    if not rows:
+        return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=str), np.zeros((0, dim), dtype=np.float32),
+                np.zeros(0, dtype=np.float32))
+    ids, dates, blobs, labels = zip(*rows)
+    X = np.frombuffer(b''.join(blobs), dtype=np.float32).reshape(len(rows), -1)
+    return np.asarray(ids, dtype=np.int64), np.asarray(dates, dtype=str), X, np.asarray(labels, dtype=np.float32)
+
+
+def mark_trained(db_path, history_ids, checkpoint_id):
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany("UPDATE credit_features SET checkpoint_id=? WHERE history_id=?",
+                         [(int(checkpoint_id), int(i)) for i in history_ids])
+
+
+def load_features(db_path, after_id=None, archive_dir=None):
+    """Kayıtlı model girdileri (history_id indeksli). Metin kodları kategorik, sayılar 32 bit okunur.
+    after_id: sadece bu kayıttan sonra eklenenler. archive_dir: verilirse arşive taşınmış girdiler de okunur."""
+    query = f"SELECT history_id, {', '.join(FEATURE_COLUMNS)} FROM credit_features"
+    params = ()
+    if after_id is not None:
+        query += " WHERE history_id > ?"
+        params = (int(after_id),)
+    with sqlite3.connect(db_path) as conn:
+        df = pd.read_sql_query(query + " ORDER BY history_id", conn, params=params)
+    if archive_dir is not None:
+        cold = read_cold('credit_features', ['history_id', *FEATURE_COLUMNS], archive_dir=archive_dir,
+                         filters=None if after_id is None else [('history_id', '>', int(after_id))])
+        if not cold.empty:
+            df = pd.concat([cold, df], ignore_index=True).drop_duplicates('history_id', keep='last')
+            df = df.sort_values('history_id')
+    for col, sql_type in FEATURE_COLUMNS.items():
+        df[col] = df[col].astype({'TEXT': 'category', 'INTEGER': 'int32', 'REAL': 'float32'}[sql_type])
+    return df.set_index('history_id')
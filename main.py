@@ -144,4 +144,10 @@ print("✅ Model başarıyla kaydedildi: kredi_risk_modeli.keras")
 # 2. Ön İşleyiciyi (Scaler ve Encoder) Kaydet
 # Yeni gelen ham veriyi, modelin anladığı dile çevirmek için buna mecburuz.
 joblib.dump(preprocessor, 'veri_isleyici.pkl')
-print("✅ Veri işleyici başarıyla kaydedildi: veri_isleyici.pkl")
\ No newline at end of file
+print("✅ Veri işleyici başarıyla kaydedildi: veri_isleyici.pkl")
+
+# 3. Kayma (drift) izleme için eğitim anı referansı: aynı sabit kovalarla özellik ve ham skor dağılımları
+from drift_engine import build_reference, save_reference
+train_scores = ((1 - model.predict(X_train, verbose=0)[:, 0]) * 1900).astype(int)
+save_reference(build_reference(X_train_raw, train_scores))
+print("✅ Kayma izleme referansı kaydedildi: drift_referans.json")
\ No newline at end of file
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+SCORE_MAX = 1900
+DEFAULT_LGD = 0.45  # Temerrüt halinde kayıp oranı (Basel temel yaklaşım)
+CHUNK_SIZE = 20000  # Bellek tavanı: parça başına (kredi x ay) matris
+MIN_MONTHLY_RATE = 1e-8
+MAX_HAZARD = 1 - 1e-9
+
+
+def _monthly_rate(rates):
+    # calculate_payment ile aynı varsayım: yıllık % faiz / 12.
+    # Sıfır faiz calculate_payment'ta da tanımsız; sayısal kararlılık için çok küçük bir tabana çekilir.
+    return np.maximum(np.asarray(rates, dtype=np.float64) / 100 / 12, MIN_MONTHLY_RATE)
+
+
+def _annuity(p, r, n):
+    growth = np.exp(n * np.log1p(r))
+    return p * (r * growth) / (growth - 1)
+
+
+def annuity_payment(amounts, durations, rates):
+    """calculate_payment'ın vektörel karşılığı: aylık eşit taksit (yuvarlanmamış)."""
+    return _annuity(np.asarray(amounts, dtype=np.float64), _monthly_rate(rates),
+                    np.asarray(durations, dtype=np.float64))
+
+
+def _coefficients(p, r, n):
+    """k taksit ödendikten sonra kalan anapara: B(k) = c0 - c1 * (1+r)^k."""
+    g_n = np.exp(n * np.log1p(r))
+    return p * g_n / (g_n - 1), p / (g_n - 1)
+
+
+def default_hazard(scores, durations):
+    """Hibrit skordan (0-1900) vade boyu temerrüt olasılığı ve bunun aylık sabit hazard karşılığı."""
+    pd_life = 1 - np.clip(np.asarray(scores, dtype=np.float64), 0, SCORE_MAX) / SCORE_MAX
+    n = np.maximum(np.asarray(durations, dtype=np.float64), 1)
+    return np.minimum(1 - (1 - pd_life) ** (1 / n), MAX_HAZARD)
+
+
+def _active_sum(weights, remaining, horizon):
+    """sum_i w_i * [j < kalan_i] her ay j için; matris kurmadan (bincount + ters kümülatif toplam)."""
+    by_rem = np.bincount(np.minimum(remaining, horizon), weights=weights, minlength=horizon + 1)
+    return by_rem[::-1].cumsum()[::-1][1:]
+
+
+def portfolio_projection(amounts, durations, rates, scores, elapsed=None, horizon=None, lgd=DEFAULT_LGD,
+                         chunk_size=CHUNK_SIZE):
+    """Onaylı kredi portföyünün bugünden itibaren aylık nakit akışı ve beklenen kayıp projeksiyonu.
+    Kredi bazında matris saklanmaz: kalan bakiye c0 - c1*(1+r)^k kapalı formuyla ay toplamları
+    parça parça matris-vektör çarpımlarıyla birikir (bellek: chunk_size x horizon).
+    Dönüş: ay bazında toplamlar içeren DataFrame."""
+    p = np.asarray(amounts, dtype=np.float64)
+    n = np.asarray(durations, dtype=np.float64)
+    r = _monthly_rate(rates)
+    e = np.zeros_like(n) if elapsed is None else np.clip(np.asarray(elapsed, dtype=np.float64), 0, n)
+    rem = (n - e).astype(np.int64)
+    if horizon is None:
+        horizon = int(rem.max()) if len(p) else 0
+    h = default_hazard(scores, n)
+
+    pay = _annuity(p, r, n)
+    c0, c1 = _coefficients(p, r, n)
+    w = c1 * np.exp(e * np.log1p(r))  # c1 * (1+r)^e
+    log_g, log_s = np.log1p(r), np.log1p(-h)
+
+    # Sabit terimler ayın aktif olup olmamasına bağlı: matrissiz hesaplanır
+    taksit = _active_sum(pay, rem, horizon)
+    bal_prev = _active_sum(c0, rem, horizon)
+    faiz = _active_sum(c0 * r, rem, horizon)
+    beklenen_taksit = np.zeros(horizon)
+    beklenen_kayip = np.zeros(horizon)
+
+    j = np.arange(horizon, dtype=np.float64)[None, :]
+    for s in range(0, len(p), chunk_size):
+        sl = slice(s, s + chunk_size)
+        active = j < rem[sl, None]
+        growth = np.exp(np.where(active, j * log_g[sl, None], -np.inf))  # (1+r)^j, pasif aylarda 0
+        surv = np.exp(np.where(active, j * log_s[sl, None], -np.inf))  # ay başında hâlâ ödeyen olma olasılığı
+        bal_prev -= w[sl] @ growth
+        faiz -= (w[sl] * r[sl]) @ growth
+        beklenen_taksit += (pay[sl] * (1 - h[sl])) @ surv
+        beklenen_kayip += (h[sl] * c0[sl]) @ surv - (h[sl] * w[sl]) @ (growth * surv)
+
+    out = pd.DataFrame({'ay': np.arange(1, horizon + 1), 'taksit': taksit, 'anapara': taksit - faiz, 'faiz': faiz,
+                        'bakiye': bal_prev + faiz - taksit, 'beklenen_taksit': beklenen_taksit,
+                        'beklenen_kayip': beklenen_kayip * lgd})
+    out['kumulatif_kayip'] = out['beklenen_kayip'].cumsum()
+    return out
@@ -0,0 +1,166 @@
+import json
+import numpy as np
+import pandas as pd
+from feature_store import FEATURE_COLUMNS
+
+SCORE_MIN, SCORE_MAX = 0, 1900
+
+# Varsayılan banka politikası (veritabanı ilk kurulduğunda policy_rules tablosuna yazılır)
+# grup: aynı gruptaki kurallardan sadece sıraya göre İLK eşleşen uygulanır (if/elif mantığı)
+# asama: 'skor' -> puan ekler/çıkarır, 'karar' -> kırpılmış skor üzerinden toplu sorgu kararını ezer
+DEFAULT_RULES = [
+    {"kod": "vip_segment", "sira": 10, "grup": "meslek", "asama": "skor",
+     "kosul": [["job", "==", "A171"], ["credit_history", "==", "A34"], ["credit_amount", ">", 10000]],
+     "puan": 750, "sonuc": None, "mesaj": "🌟 VIP Segment: Kurumsal onay desteği (+750)"},
+    {"kod": "yonetici_bonus", "sira": 20, "grup": "meslek", "asama": "skor",
+     "kosul": [["job", "==", "A171"], ["credit_history", "==", "A34"]],
+     "puan": 300, "sonuc": None, "mesaj": "✅ Gelir Gücü: Yönetici statüsü bonusu (+300)"},
+    {"kod": "nitelikli_personel", "sira": 30, "grup": "meslek", "asama": "skor",
+     "kosul": [["job", "==", "A173"]],
+     "puan": 150, "sonuc": None, "mesaj": "✅ İstihdam: Nitelikli personel bonusu (+150)"},
+    {"kod": "kusursuz_sicil", "sira": 40, "grup": "sicil", "asama": "skor",
+     "kosul": [["credit_history", "==", "A34"]],
+     "puan": 250, "sonuc": None, "mesaj": "✅ Finansal Sicil: Kusursuz ödeme geçmişi (+250)"},
+    {"kod": "sorunlu_kkb", "sira": 50, "grup": "sicil", "asama": "skor",
+     "kosul": [["credit_history", "in", ["A30", "A31", "A33"]]],
+     "puan": -450, "sonuc": None, "mesaj": "⛔ Kritik Risk: KKB kayıtları sorunlu (-450)"},
+    {"kod": "gayrimenkul_teminat", "sira": 60, "grup": "konut", "asama": "skor",
+     "kosul": [["housing", "==", "A152"]],
+     "puan": 150, "sonuc": None, "mesaj": "✅ Teminat: Gayrimenkul güvencesi (+150)"},
+    {"kod": "yuksek_borclanma", "sira": 70, "grup": "borclanma", "asama": "skor",
+     "kosul": [["installment_rate", "==", 4]],
+     "puan": -250, "sonuc": None, "mesaj": "⛔ Borçlanma Oranı: Gelire göre taksitler çok yüksek (-250)"},
+    {"kod": "yuksek_tutar_red", "sira": 100, "grup": "karar", "asama": "karar",
+     "kosul": [["tutar", ">", 750000], ["skor", "<", 1700]],
+     "puan": 0, "sonuc": "RED (Yüksek Risk)",
+     "mesaj": "⛔ Yüksek Tutar: 750.000 TL üzeri başvuruda skor 1700 altında"},
+]
+
+OPERATORS = {
+    "==": lambda col, v: col == v,
+    "!=": lambda col, v: col != v,
+    ">": lambda col, v: col > v,
+    ">=": lambda col, v: col >= v,
+    "<": lambda col, v: col < v,
+    "<=": lambda col, v: col <= v,
+    "in": lambda col, v: np.isin(col, list(v)),
+    "not in": lambda col, v: ~np.isin(col, list(v)),
+}
+
+ASAMALAR = ("skor", "karar")
+# Aşama başına koşulda kullanılabilecek alanlar ve tipleri ('karar' aşaması kırpılmış skor ve TL tutar görür)
+RULE_FIELDS = {"skor": FEATURE_COLUMNS, "karar": {"skor": "INTEGER", "tutar": "REAL"}}
+COMPARISONS = (">", ">=", "<", "<=")
+RULE_COLUMNS = ["kod", "sira", "grup", "asama", "kosul", "puan", "sonuc", "mesaj", "aktif"]
+
+
+def clean_rule(rule):
+    """Tablo düzenleyiciden / veritabanından gelen boş (NaN) hücreleri None yapar."""
+    return {k: (None if isinstance(v, float) and np.isnan(v) else v) for k, v in rule.items()}
+
+
+def _is_number(v):
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+
+def _check_clause(kod, asama, field, op, value):
+    # Kayıtta yakalanmayan alan/tip hatası her skorlamada KeyError/UFuncTypeError olarak patlar
+    fields = RULE_FIELDS[asama]
+    if field not in fields:
+        raise ValueError(f"{kod}: '{asama}' aşamasında bilinmeyen alan '{field}' (geçerli: {', '.join(fields)})")
+    text = fields[field] == 'TEXT'
+    if op in COMPARISONS and (text or not _is_number(value)):
+        raise ValueError(f"{kod}: '{field} {op}' karşılaştırması sayısal alan ve sayısal değer ister")
+    if op in ("in", "not in") and not isinstance(value, list):
+        raise ValueError(f"{kod}: '{op}' için değer liste olmalı, ör. [\"A30\", \"A31\"]")
+    for v in value if op in ("in", "not in") else [value]:
+        if not (isinstance(v, str) if text else _is_number(v)):
+            raise ValueError(f"{kod}: '{field}' alanı {'metin kod' if text else 'sayı'} ister, {v!r} geçersiz")
+
+
+def compile_rules(rules):
+    """Kural satırlarını (dict listesi) sıralı, doğrulanmış ve çalıştırılabilir hale getirir.
+    Hatalı kuralda ValueError fırlatır."""
+    compiled = []
+    for r in sorted(map(clean_rule, rules), key=lambda x: int(x["sira"])):
+        if r.get("aktif") is not None and not int(r["aktif"]):
+            continue
+        kosul = r["kosul"]
+        if isinstance(kosul, str):
+            kosul = json.loads(kosul)
+        if r["asama"] not in ASAMALAR:
+            raise ValueError(f"{r['kod']}: bilinmeyen aşama '{r['asama']}'")
+        if r["asama"] == "karar" and not r.get("sonuc"):
+            raise ValueError(f"{r['kod']}: karar kuralı için sonuç zorunlu")
+        clauses = []
+        for clause in kosul:
+            if len(clause) != 3 or clause[1] not in OPERATORS:
+                raise ValueError(f"{r['kod']}: geçersiz koşul {clause}")
+            _check_clause(r["kod"], r["asama"], *clause)
+            clauses.append(tuple(clause))
+        compiled.append({
+            "kod": r["kod"], "grup": r.get("grup") or r["kod"], "asama": r["asama"],
+            "kosul": clauses, "puan": int(r.get("puan") or 0), "sonuc": r.get("sonuc"),
+            "mesaj": r.get("mesaj") or "",
+        })
+    return compiled
+
+
+def _mask(clauses, columns, n):
+    m = np.ones(n, dtype=bool)
+    for field, op, value in clauses:
+        m &= OPERATORS[op](np.asarray(columns[field]), value)
+    return m
+
+
+def _evaluate(policy, asama, columns, n, msgs, hits):
+    """Bir aşamanın kurallarını tüm satırlara maske olarak uygular; (kural, isabet maskesi) üretir."""
+    taken = {}
+    for rule in policy:
+        if rule["asama"] != asama:
+            continue
+        grp = taken.setdefault(rule["grup"], np.zeros(n, dtype=bool))
+        hit = _mask(rule["kosul"], columns, n) & ~grp
+        grp |= hit
+        hits[rule["kod"]] = int(hit.sum())
+        if rule["mesaj"]:
+            for i in np.flatnonzero(hit):
+                msgs[i].append(rule["mesaj"])
+        yield rule, hit
+
+
+def apply_score_rules(policy, raw_scores, features):
+    """Ham model skorlarına 'skor' aşaması kurallarını tek geçişte uygular ve 0-1900 aralığına kırpar.
+    features: kural alanlarını içeren DataFrame (veya sütun sözlüğü).
+    Dönüş: (skorlar, satır başına mesaj listeleri, kural başına isabet sayıları)"""
+    raw = np.asarray(raw_scores, dtype=np.int64)
+    n = len(raw)
+    msgs = [[] for _ in range(n)]
+    hits = {}
+    delta = np.zeros(n, dtype=np.int64)
+    for rule, hit in _evaluate(policy, "skor", features, n, msgs, hits):
+        delta[hit] += rule["puan"]
+    scores = np.clip(raw + delta, SCORE_MIN, SCORE_MAX).astype(int)
+    return scores, msgs, hits
+
+
+def apply_decision_rules(policy, decisions, scores, amounts, msgs=None):
+    """'karar' aşaması kurallarını (ör. yüksek tutar reddi) kırpılmış skorlar üzerinden uygular.
+    msgs verilirse kural mesajları ilgili satırlara eklenir."""
+    decisions = np.asarray(decisions, dtype=object).copy()
+    n = len(decisions)
+    if msgs is None:
+        msgs = [[] for _ in range(n)]
+    columns = {"skor": np.asarray(scores), "tutar": np.asarray(amounts, dtype=float)}
+    hits = {}
+    for rule, hit in _evaluate(policy, "karar", columns, n, msgs, hits):
+        decisions[hit] = rule["sonuc"]
+    return decisions, msgs, hits
+
+
+def rules_to_frame(rules):
+    """Kural listesini yönetici ekranında düzenlenebilir tabloya çevirir (koşullar JSON metni olarak)."""
+    df = pd.DataFrame(rules, columns=RULE_COLUMNS)
+    df["kosul"] = df["kosul"].map(lambda k: k if isinstance(k, str) else json.dumps(k, ensure_ascii=False))
+    df["aktif"] = df["aktif"].fillna(1).astype(int)
+    return df
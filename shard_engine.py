@@ -0,0 +1,50 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from archive_engine import ARCHIVE_DIR
+
+# Merkez veritabanı: kullanıcılar, şubeler, banka politikası (ayarlar ve kurallar).
+# Şube parçaları (shard): her şubenin credit_history ve audit_logs tabloları ayrı dosyada tutulur.
+# Varsayılan şubenin parçası merkez dosyanın kendisidir; tek şubeli eski kurulumlar aynen çalışır.
+CENTRAL_DB = 'banka_veritabani.db'
+DEFAULT_BRANCH = 'MERKEZ'
+SHARD_DIR = 'subeler'
+MAX_FAN_OUT_WORKERS = 16
+
+BRANCH_CODE_RE = re.compile(r'^[A-Z0-9_]{2,20}$')
+
+
+def valid_branch_code(kod):
+    # Şube kodu dosya adında kullanılır; sadece büyük harf, rakam ve alt çizgi
+    return bool(BRANCH_CODE_RE.match(kod or ''))
+
+
+def shard_path(kod):
+    if kod == DEFAULT_BRANCH:
+        return CENTRAL_DB
+    return os.path.join(SHARD_DIR, f"sube_{kod}.db")
+
+
+def shard_archive_dir(kod):
+    if kod == DEFAULT_BRANCH:
+        return ARCHIVE_DIR
+    return os.path.join(ARCHIVE_DIR, f"sube_{kod}")
+
+
+def fan_out(fn, branches, max_workers=MAX_FAN_OUT_WORKERS):
+    """fn(kod) çağrılarını tüm şubeler için paralel çalıştırır ve {kod: sonuç} döner.
+    SQLite sorguları ve parquet okumaları GIL'i bıraktığı için iş parçacıkları gerçekten paralel ilerler."""
+    branches = list(branches)
+    if not branches:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(branches))) as ex:
+        return dict(zip(branches, ex.map(fn, branches)))
+
+
+def merge_frames(frames, col='sube_id'):
+    """{kod: DataFrame} sonuçlarını şube sütunu ekleyerek tek tabloda birleştirir."""
+    parts = [df.assign(**{col: kod}) for kod, df in frames.items() if df is not None and not df.empty]
+    if not parts:
+        return pd.DataFrame()
+    return pd.concat(parts, ignore_index=True)
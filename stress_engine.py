@@ -0,0 +1,132 @@
+import json
+import numpy as np
+import pandas as pd
+from rule_engine import OPERATORS, apply_score_rules, apply_decision_rules, _check_clause, _is_number
+from feature_store import FEATURE_COLUMNS
+
+MODEL_SCALE_FACTOR = 80  # credit_amount model ölçeğinde (TL/80)
+STRESS_CHUNK_ROWS = 50000  # Parça başına model çağrısı (bellek tavanı)
+PREDICT_BATCH_SIZE = 4096  # model.predict varsayılanı (32) büyük portföyde çok yavaş
+
+# Şok işlemleri; değer sütunun kendi biriminde (credit_amount model ölçeğinde, oransal şok için '*' kullanın).
+# Kategorik kodlarda sadece '=' geçerlidir.
+SHOCK_OPS = {
+    "+": lambda col, v: col + v,
+    "*": lambda col, v: col * v,
+    "=": lambda col, v: np.full(len(col), v, dtype=object if isinstance(v, str) else None),
+}
+
+# Senaryo: kosul (kural motoruyla aynı koşul dili) sağlayan başvurulara sok listesindeki değişiklikler uygulanır
+DEFAULT_SCENARIOS = [
+    {"ad": "Vade +12 ay", "kosul": [], "sok": [["duration", "+", 12]]},
+    {"ad": "Tutar +%20", "kosul": [], "sok": [["credit_amount", "*", 1.2]]},
+    {"ad": "KKB A32 → A31", "kosul": [["credit_history", "==", "A32"]], "sok": [["credit_history", "=", "A31"]]},
+    {"ad": "Vade +12 ay ve Tutar +%20", "kosul": [], "sok": [["duration", "+", 12], ["credit_amount", "*", 1.2]]},
+]
+SCENARIO_COLUMNS = ["ad", "kosul", "sok"]
+
+
+def _check_shock(ad, field, op, value):
+    # Metin kodlar sadece '=' ile ve metin değerle, sayısal alanlar sayısal değerle değiştirilir
+    if FEATURE_COLUMNS[field] == 'TEXT':
+        if op != "=" or not isinstance(value, str):
+            raise ValueError(f"{ad}: '{field}' metin kod alanı; sadece '=' ve metin değer, ör. [\"{field}\", \"=\", "
+                             f"\"A31\"]")
+    elif not _is_number(value):
+        raise ValueError(f"{ad}: '{field} {op}' şoku sayısal değer ister, {value!r} geçersiz")
+
+
+def compile_scenarios(rows):
+    """Senaryo satırlarını (kosul/sok JSON metni olabilir) doğrular. Hatalı senaryoda ValueError fırlatır."""
+    compiled = []
+    for r in rows:
+        kosul, sok = [json.loads(v) if isinstance(v, str) else (v or []) for v in (r.get("kosul"), r.get("sok"))]
+        if not r.get("ad"):
+            raise ValueError("Senaryo adı zorunlu")
+        for clause in kosul:
+            if len(clause) != 3 or clause[1] not in OPERATORS:
+                raise ValueError(f"{r['ad']}: geçersiz koşul {clause}")
+            _check_clause(r["ad"], "skor", *clause)  # Kural motorunun alan ve değer tipi denetimi
+        if not sok:
+            raise ValueError(f"{r['ad']}: en az bir şok gerekli")
+        for shock in sok:
+            if len(shock) != 3 or shock[0] not in FEATURE_COLUMNS or shock[1] not in SHOCK_OPS:
+                raise ValueError(f"{r['ad']}: geçersiz şok {shock}")
+            _check_shock(r["ad"], *shock)
+        compiled.append({"ad": r["ad"], "kosul": [tuple(c) for c in kosul], "sok": [tuple(s) for s in sok]})
+    return compiled
+
+
+def scenarios_to_frame(scenarios):
+    """Senaryoları yönetici ekranında düzenlenebilir tabloya çevirir (koşul ve şoklar JSON metni olarak)."""
+    df = pd.DataFrame(scenarios, columns=SCENARIO_COLUMNS)
+    for col in ("kosul", "sok"):
+        df[col] = df[col].map(lambda v: v if isinstance(v, str) else json.dumps(v, ensure_ascii=False))
+    return df
+
+
+def apply_scenario(features, scenario):
+    """Şokları koşulu sağlayan satırlara dizi işlemleri olarak uygular. Dönüş: (şoklanmış kopya, etkilenen maske)"""
+    mask = np.ones(len(features), dtype=bool)
+    for field, op, value in scenario["kosul"]:
+        mask &= OPERATORS[op](np.asarray(features[field]), value)
+    shocked = features.copy()
+    for field, op, value in scenario["sok"]:
+        col = np.asarray(shocked[field])
+        new = SHOCK_OPS[op](col, value)
+        if FEATURE_COLUMNS[field] == 'INTEGER':
+            new = np.maximum(np.round(new.astype(float)), 1).astype(col.dtype)
+        shocked[field] = np.where(mask, new, col)
+        if FEATURE_COLUMNS[field] == 'TEXT':
+            shocked[field] = shocked[field].astype('category')
+    return shocked, mask
+
+
+def score_features(model, preprocessor, policy, features, threshold, scale=MODEL_SCALE_FACTOR,
+                   chunk_rows=STRESS_CHUNK_ROWS):
+    """Model + hibrit kurallarla (skor ve karar aşaması) büyük parçalar halinde yeniden skorlar.
+    Dönüş: (kırpılmış skorlar, ONAY/RED/kural sonucu kararları)"""
+    n = len(features)
+    scores = np.zeros(n, dtype=np.int64)
+    decisions = np.empty(n, dtype=object)
+    for s in range(0, n, chunk_rows):
+        part = features.iloc[s:s + chunk_rows]
+        risk = model.predict(preprocessor.transform(part), batch_size=PREDICT_BATCH_SIZE, verbose=0)[:, 0]
+        sc, _, _ = apply_score_rules(policy, ((1 - risk) * 1900).astype(int), part)
+        dec = np.where(sc >= threshold, "ONAY", "RED").astype(object)
+        dec, _, _ = apply_decision_rules(policy, dec, sc, np.asarray(part['credit_amount'], dtype=float) * scale)
+        scores[s:s + len(part)], decisions[s:s + len(part)] = sc, dec
+    return scores, decisions
+
+
+def _summary(name, amounts, scores, approved, affected):
+    return {"Senaryo": name, "Etkilenen Başvuru": int(affected), "Onay Oranı (%)": approved.mean() * 100,
+            "Onaylı Hacim (TL)": float(amounts[approved].sum()), "Ortalama Skor": scores.mean()}
+
+
+def stress_test(model, preprocessor, policy, features, threshold, scenarios, scale=MODEL_SCALE_FACTOR):
+    """Portföyü önce şoksuz, sonra her senaryo altında yeniden skorlar; senaryo başına onay ve hacim farkları.
+    Sadece senaryonun etkilediği satırlar yeniden skorlanır; diğerleri şoksuz sonuçtan alınır."""
+    base_scores, base_dec = score_features(model, preprocessor, policy, features, threshold, scale)
+    base_ok = base_dec == "ONAY"
+    base_amounts = np.asarray(features['credit_amount'], dtype=np.float64) * scale
+    rows = [{**_summary("Mevcut (Şoksuz)", base_amounts, base_scores, base_ok, 0), "Onaydan Redde": 0,
+             "Redden Onaya": 0}]
+
+    for scenario in scenarios:
+        shocked, mask = apply_scenario(features, scenario)
+        scores, dec = base_scores.copy(), base_dec.copy()
+        if mask.any():
+            scores[mask], dec[mask] = score_features(model, preprocessor, policy, shocked[mask], threshold, scale)
+        ok = dec == "ONAY"
+        row = _summary(scenario["ad"], np.asarray(shocked['credit_amount'], dtype=np.float64) * scale, scores, ok,
+                       mask.sum())
+        row.update({"Onaydan Redde": int((base_ok & ~ok).sum()), "Redden Onaya": int((~base_ok & ok).sum())})
+        rows.append(row)
+
+    report = pd.DataFrame(rows)
+    base = report.iloc[0]
+    report["Δ Onay Oranı (puan)"] = report["Onay Oranı (%)"] - base["Onay Oranı (%)"]
+    report["Δ Onaylı Hacim (TL)"] = report["Onaylı Hacim (TL)"] - base["Onaylı Hacim (TL)"]
+    report["Δ Ortalama Skor"] = report["Ortalama Skor"] - base["Ortalama Skor"]
+    return report
@@ -0,0 +1,124 @@
+import os
+import shutil
+import sqlite3
+import datetime
+import numpy as np
+import tensorflow as tf
+from sklearn.utils import class_weight
+from feature_store import load_training_vectors, mark_trained
+
+MODEL_PATH = 'kredi_risk_modeli.keras'
+CHECKPOINT_DIR = 'modeller'
+MIN_NEW_RECORDS = 50  # Daha az yeni kararla ince ayar yapılmaz
+FINE_TUNE_EPOCHS = 10
+FINE_TUNE_LR = 1e-4  # İlk eğitimin (main.py, 1e-3) onda biri: mevcut ağırlıklar korunur, sadece kaydırılır
+FINE_TUNE_BATCH_SIZE = 32
+VALIDATION_SPLIT = 0.2  # Tüm şubelerin kayıtları karar tarihine göre sıralanır; doğrulama en yeni kararlardır
+
+# Merkez veritabanında: her ince ayarın modeli, bir önceki modeli ve kullandığı kayıt sayısı.
+# uygulandi = 0: yeni model doğrulama kaybını iyileştirmedi, mevcut model korundu (model_path boş)
+CHECKPOINT_TABLE_SQL = '''CREATE TABLE IF NOT EXISTS model_checkpoints (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, tarih TIMESTAMP DEFAULT CURRENT_TIMESTAMP, model_path TEXT,
+    onceki_model TEXT, kayit_sayisi INTEGER, val_loss REAL, kullanici TEXT)'''
+CHECKPOINT_COLUMNS = {'onceki_val_loss': 'REAL', 'uygulandi': 'INTEGER DEFAULT 1'}  # Eski tablolara göçle eklenir
+
+
+def init_checkpoint_table(conn):
+    conn.execute(CHECKPOINT_TABLE_SQL)
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(model_checkpoints)").fetchall()]
+    for col, sql_type in CHECKPOINT_COLUMNS.items():
+        if col not in cols:
+            conn.execute(f"ALTER TABLE model_checkpoints ADD COLUMN {col} {sql_type}")
+
+
+def _previous_model(central_db, model_path, checkpoint_dir):
+    """Geri dönüş için bir önceki modelin yolu; ilk ince ayarda orijinal model yedeklenir."""
+    with sqlite3.connect(central_db) as conn:
+        last = conn.execute("SELECT model_path FROM model_checkpoints WHERE uygulandi = 1 "
+                            "ORDER BY id DESC LIMIT 1").fetchone()
+    if last and os.path.exists(last[0]):
+        return last[0]
+    backup = os.path.join(checkpoint_dir, 'kredi_risk_modeli_baslangic.keras')
+    if not os.path.exists(backup):
+        shutil.copy2(model_path, backup)
+    return backup
+
+
+def fine_tune(db_paths, central_db, model_path=MODEL_PATH, checkpoint_dir=CHECKPOINT_DIR, min_records=MIN_NEW_RECORDS,
+              epochs=FINE_TUNE_EPOCHS, user=None):
+    """Mevcut modeli yükler ve sadece son ince ayardan bu yana müdür kararı almış kayıtlarla eğitmeye devam eder.
+    Süre tüm geçmişle değil yeni kayıt sayısıyla ölçeklenir. Mevcut model önce aynı doğrulama diliminde ölçülür;
+    yeni model sadece doğrulama kaybını iyileştirirse sürümlü olarak checkpoint_dir'e yazılır, model_path atomik
+    olarak değiştirilir ve kullanılan kayıtlar checkpoint numarasıyla işaretlenir. İyileştirmeyen çalıştırma
+    uygulanmadı olarak kaydedilir; kayıtları bir sonraki ince ayarda tekrar kullanılır. Eğitim veya doğrulama
+    diliminde onay ve ret kararlarının ikisi birden yoksa model eğitilmez.
+    db_paths: şube parçalarının veritabanı yolları. Dönüş: sonuç özeti (dict)"""
+    model = tf.keras.models.load_model(model_path)
+    dim = model.input_shape[-1]
+    parts = {path: load_training_vectors(path, dim) for path in db_paths}
+    ids = np.concatenate([p[0] for p in parts.values()])
+    dates = np.concatenate([p[1] for p in parts.values()])
+    X = np.concatenate([p[2] for p in parts.values()])
+    y = np.concatenate([p[3] for p in parts.values()])
+    shard = np.concatenate([np.full(len(p[0]), i) for i, p in enumerate(parts.values())])
+    if len(y) < min_records:
+        return {'guncellendi': False, 'kayit_sayisi': len(y)}
+
+    # Şube sırasına değil karar zamanına göre: eğitim eski, doğrulama en yeni kararlar (aynı anda: kayıt sırası)
+    order = np.lexsort((ids, dates))
+    X, y, ids, shard = X[order], y[order], ids[order], shard[order]
+
+    # Mevcut ve yeni model aynı doğrulama diliminde (son %20) karşılaştırılır; bu dilim eğitimde kullanılmaz
+    split = len(y) - max(1, int(len(y) * VALIDATION_SPLIT))
+    X_val, y_val = X[split:], y[split:]
+
+    # Tek sınıflı dilimde kayıp anlamlı karşılaştırılamaz ve model tek sınıfa kayar: eğitim yapılmaz
+    if len(np.unique(y[:split])) < 2 or len(np.unique(y_val)) < 2:
+        return {'guncellendi': False, 'kayit_sayisi': len(y), 'tek_sinif': True}
+
+    # main.py'deki gibi dengeli sınıf ağırlıkları
+    classes = np.unique(y[:split])
+    weights = dict(enumerate(class_weight.compute_class_weight('balanced', classes=classes, y=y[:split])))
+
+    model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=FINE_TUNE_LR), loss='binary_crossentropy',
+                  metrics=['accuracy', tf.keras.metrics.Precision(name='precision'),
+                           tf.keras.metrics.Recall(name='recall')])
+    base_loss = float(model.evaluate(X_val, y_val, batch_size=FINE_TUNE_BATCH_SIZE, verbose=0)[0])
+    history = model.fit(X[:split], y[:split], epochs=epochs, batch_size=FINE_TUNE_BATCH_SIZE,
+                        validation_data=(X_val, y_val), class_weight=weights, verbose=0,
+                        callbacks=[tf.keras.callbacks.EarlyStopping(monitor='val_loss', patience=3,
+                                                                    restore_best_weights=True)])
+    val_loss = float(min(history.history['val_loss']))
+    result = {'kayit_sayisi': len(y), 'val_loss': val_loss, 'onceki_val_loss': base_loss,
+              'epoch': len(history.history['loss'])}
+
+    if val_loss >= base_loss:
+        with sqlite3.connect(central_db) as conn:
+            result['checkpoint_id'] = conn.execute("""INSERT INTO model_checkpoints (kayit_sayisi, val_loss,
+                onceki_val_loss, uygulandi, kullanici) VALUES (?, ?, ?, 0, ?)""",
+                                                   (len(y), val_loss, base_loss, user)).lastrowid
+        return {'guncellendi': False, **result}
+
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    previous = _previous_model(central_db, model_path, checkpoint_dir)
+    new_path = os.path.join(checkpoint_dir, f"kredi_risk_modeli_{datetime.datetime.now():%Y%m%d_%H%M%S}.keras")
+    model.save(new_path)
+    shutil.copy2(new_path, model_path + '.tmp')
+    os.replace(model_path + '.tmp', model_path)  # Uygulama yarım yazılmış dosya görmez
+
+    with sqlite3.connect(central_db) as conn:
+        checkpoint_id = conn.execute("""INSERT INTO model_checkpoints (model_path, onceki_model, kayit_sayisi, val_loss,
+            onceki_val_loss, uygulandi, kullanici) VALUES (?, ?, ?, ?, ?, 1, ?)""",
+                                     (new_path, previous, len(y), val_loss, base_loss, user)).lastrowid
+    for i, path in enumerate(parts):
+        mark_trained(path, ids[shard == i], checkpoint_id)
+    return {'guncellendi': True, 'checkpoint_id': checkpoint_id, 'model_path': new_path, **result}
+
+
+if __name__ == '__main__':
+    # Zamanlanmış görev olarak: python training_engine.py
+    from shard_engine import CENTRAL_DB, shard_path
+    with sqlite3.connect(CENTRAL_DB) as conn:
+        init_checkpoint_table(conn)
+        kodlar = [r[0] for r in conn.execute("SELECT kod FROM branches").fetchall()]
+    print(fine_tune([shard_path(k) for k in kodlar], CENTRAL_DB, user='zamanlanmis_gorev'))